@@ -11,8 +11,58 @@ class Settings:
     MONGODB_URI: str = os.getenv("MONGODB_URI")
     MONGODB_DB: str = os.getenv("MONGODB_DB")
     MAX_REQUESTS_PER_DAY: int = int(os.getenv("MAX_REQUESTS_PER_DAY", "100"))
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"  # Reject users over MAX_REQUESTS_PER_DAY before any other work
+    ADMISSION_WINDOW: int = int(os.getenv("ADMISSION_WINDOW", "86400"))  # Seconds of the sliding window MAX_REQUESTS_PER_DAY applies to
+    ADMISSION_SYNC_INTERVAL: float = float(os.getenv("ADMISSION_SYNC_INTERVAL", "5"))  # Seconds between syncs of request counters with MongoDB
     MAX_DURATION_AFTER_LAST_MESSAGE: int = int(os.getenv("MAX_DURATION_AFTER_LAST_MESSAGE", "3600"))
+    MAX_ACTIVE_SESSIONS: int = int(os.getenv("MAX_ACTIVE_SESSIONS", "10000"))  # Least recently used sessions are evicted beyond this
+    SESSION_STORE: str = os.getenv("SESSION_STORE", "memory")  # "memory" (single worker) or "mongodb" (shared across workers/replicas)
+    SESSION_REHYDRATE_MESSAGES: int = int(os.getenv("SESSION_REHYDRATE_MESSAGES", "20"))  # Persisted messages replayed into a rebuilt chat
+    SESSION_SWEEP_INTERVAL: float = float(os.getenv("SESSION_SWEEP_INTERVAL", "10"))  # Seconds between expired-session sweeps
     CACHE_TTL: str = os.getenv("CACHE_TTL", "3600s")
+    CACHE_REFRESH_MARGIN: int = int(os.getenv("CACHE_REFRESH_MARGIN", "600"))  # Extend the context cache this many seconds before it expires
+    CACHE_REFRESH_INTERVAL: int = int(os.getenv("CACHE_REFRESH_INTERVAL", "60"))  # Seconds between context cache expiry checks
+    CONTEXT_DOCUMENTS: str = os.getenv("CONTEXT_DOCUMENTS", "")  # More context-cached documents as name=path[@model] pairs, e.g. "en=data/info_en.md"
+    CONTEXT_CACHE_MAX_ENTRIES: int = int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "8"))  # Context caches held per worker; the least recently used is dropped beyond this
+    CONTEXT_CACHE_ADMIN_PARALLELISM: int = int(os.getenv("CONTEXT_CACHE_ADMIN_PARALLELISM", "8"))  # Concurrent calls of refresh and delete across caches
     CACHED_FILE_EXT: str = os.getenv("CACHED_FILE_EXT", "pdf")  # New: file extension for cached content
+    EXTRACTED_TEXT_DIR: str = os.getenv("EXTRACTED_TEXT_DIR", "data/extracted")  # Extracted document text, one file per content hash
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "1"))  # Processes extracting PDF pages (1: in the server process)
+    MESSAGE_BUCKET_SIZE: int = int(os.getenv("MESSAGE_BUCKET_SIZE", "50"))  # Messages per message bucket document
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "100"))  # Documents per cursor batch of a streaming export
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"  # Move the messages of idle conversations into the compressed archive
+    ARCHIVE_AFTER: int = int(os.getenv("ARCHIVE_AFTER", "2592000"))  # Seconds after its last message a conversation is archived
+    ARCHIVE_INTERVAL: float = float(os.getenv("ARCHIVE_INTERVAL", "3600"))  # Seconds between archival sweeps
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))  # Conversations archived per sweep pass
+    ARCHIVE_COMPRESSION_LEVEL: int = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))  # zlib level of archived messages
+    MONGO_WRITE_BEHIND: bool = os.getenv("MONGO_WRITE_BEHIND", "false").lower() == "true"  # Buffer turn writes and flush with bulk_write
+    MONGO_WRITE_BEHIND_INTERVAL: float = float(os.getenv("MONGO_WRITE_BEHIND_INTERVAL", "0.5"))  # Seconds between flushes
+    MONGO_WRITE_BEHIND_MAX_BATCH: int = int(os.getenv("MONGO_WRITE_BEHIND_MAX_BATCH", "100"))  # Pending writes that trigger a flush
+    GEMINI_MAX_CONCURRENT_REQUESTS: int = int(os.getenv("GEMINI_MAX_CONCURRENT_REQUESTS", "256"))  # Global in-flight Gemini calls
+    GEMINI_QUEUE_TIMEOUT: float = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))  # Seconds to wait for a slot before 503
+    GEMINI_RPM: int = int(os.getenv("GEMINI_RPM", "2000"))  # Requests per minute quota, 0 for no limit
+    GEMINI_TPM: int = int(os.getenv("GEMINI_TPM", "4000000"))  # Tokens per minute quota, 0 for no limit
+    GEMINI_MAX_RETRIES: int = int(os.getenv("GEMINI_MAX_RETRIES", "3"))  # Retries of a call failing with 429/5xx/network errors
+    GEMINI_RETRY_BASE_DELAY: float = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))  # First backoff ceiling in seconds, doubled per retry
+    GEMINI_RETRY_MAX_DELAY: float = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "8"))  # Largest backoff ceiling in seconds
+    GEMINI_REQUEST_DEADLINE: float = float(os.getenv("GEMINI_REQUEST_DEADLINE", "60"))  # Seconds a call may spend queued, retrying and waiting for Gemini
+    GEMINI_INPUT_PRICE: float = float(os.getenv("GEMINI_INPUT_PRICE", "0.075"))  # USD per million uncached prompt tokens
+    GEMINI_CACHED_INPUT_PRICE: float = float(os.getenv("GEMINI_CACHED_INPUT_PRICE", "0.01875"))  # USD per million prompt tokens read from a context cache
+    GEMINI_OUTPUT_PRICE: float = float(os.getenv("GEMINI_OUTPUT_PRICE", "0.30"))  # USD per million response tokens
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_SIZE: int = int(os.getenv("ANSWER_CACHE_MAX_SIZE", "1000"))  # Max cached answers
+    ANSWER_CACHE_TTL: int = int(os.getenv("ANSWER_CACHE_TTL", "3600"))  # Seconds an answer stays valid
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"  # Share one Gemini call among identical concurrent first-turn questions
+    CONTEXT_MODE: str = os.getenv("CONTEXT_MODE", "cache")  # "cache" binds the full context cache, "retrieval" sends top-k sections per turn
+    RETRIEVAL_TOP_K: int = int(os.getenv("RETRIEVAL_TOP_K", "4"))  # Sections sent per turn in retrieval mode
+    HISTORY_POLICY: str = os.getenv("HISTORY_POLICY", "window")  # "full", "window", "token_budget" or "summary"
+    HISTORY_MAX_TURNS: int = int(os.getenv("HISTORY_MAX_TURNS", "10"))  # Turns kept by the window and summary policies
+    HISTORY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))  # Estimated history tokens kept by the token_budget policy
+    FAQ_INDEX_ENABLED: bool = os.getenv("FAQ_INDEX_ENABLED", "true").lower() == "true"
+    FAQ_MATCH_THRESHOLD: float = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.8"))  # Min cosine score to answer from the FAQ
+    WARMUP_RETRY_INTERVAL: float = float(os.getenv("WARMUP_RETRY_INTERVAL", "10"))  # Seconds between retries of a failed startup warm-up step
+    EVALUATION_CONCURRENCY: int = int(os.getenv("EVALUATION_CONCURRENCY", "8"))  # Default concurrent Gemini calls of a bulk evaluation
+    EVALUATION_MAX_QUESTIONS: int = int(os.getenv("EVALUATION_MAX_QUESTIONS", "2000"))  # Questions accepted per bulk evaluation
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")  # Level of the JSON log lines written to stderr
 
 settings = Settings()
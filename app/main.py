@@ -1,9 +1,18 @@
 import asyncio
-from fastapi import FastAPI
-from app.routes import conversation_routes, context_cache_routes, chat_session_routes
+import logging
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.routes import conversation_routes, context_cache_routes, chat_session_routes, answer_cache_routes, faq_routes, gemini_routes, metrics_routes, token_usage_routes, evaluation_routes
 from app.services.gemini_client import GeminiClient
+from app.services.gemini_scheduler import GeminiOverloadedError
+from app.services.admission import admission, AdmissionRejected
+from app.services.readiness import readiness
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
+from app.services import telemetry
+from app.services.telemetry import log_event
+
+logging.basicConfig(level=settings.LOG_LEVEL, format="%(message)s")
 
 app = FastAPI(title="BEMO Bank Chatbot API")
 
@@ -18,31 +27,172 @@ app.add_middleware(
 app.include_router(conversation_routes.router, prefix="/api")
 app.include_router(context_cache_routes.router, prefix="/api") 
 app.include_router(chat_session_routes.router, prefix="/api")
+app.include_router(answer_cache_routes.router, prefix="/api")
+app.include_router(faq_routes.router, prefix="/api")
+app.include_router(gemini_routes.router, prefix="/api")
+app.include_router(token_usage_routes.router, prefix="/api")
+app.include_router(evaluation_routes.router, prefix="/api")
+app.include_router(metrics_routes.router)
+app.add_middleware(telemetry.RequestMetricsMiddleware)
+
+@app.exception_handler(GeminiOverloadedError)
+async def gemini_overloaded_handler(request: Request, exc: GeminiOverloadedError):
+    # Too many in-flight Gemini calls: ask the client to retry shortly.
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(settings.GEMINI_QUEUE_TIMEOUT) or 1)},
+    )
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    # The user is over their request quota.
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 @app.get("/")
 async def health_check():
     return "The health check is successful!"
 
+@app.get("/health/live")
+async def liveness():
+    # The process is up and its event loop is serving requests.
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    # 503 until MongoDB, the document indexes and (in cache mode) the context cache are warm.
+    status = readiness.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 @app.on_event("startup")
 async def startup_event():
-    # Initialize the Gemini cache from the PDF at server startup.
-    # gemini_client = GeminiClient()
-    gemini_client = GeminiClient(file_ext=settings.CACHED_FILE_EXT)
-    await gemini_client.initialize_cache()
+    # Creating the Gemini client does no I/O. Everything that does runs in the
+    # background warm-up, so the server answers liveness probes right away and
+    # reports ready on /health/ready once it can take traffic.
+    GeminiClient(file_ext=settings.CACHED_FILE_EXT)
+    asyncio.create_task(warm_up())
     # Start a background task to periodically clean up expired chat sessions.
     asyncio.create_task(cleanup_chat_sessions())
+    # Share request counts with the other workers through MongoDB.
+    if settings.ADMISSION_ENABLED:
+        asyncio.create_task(admission.run())
+    # Move the messages of idle conversations into the compressed archive.
+    if settings.ARCHIVE_ENABLED:
+        asyncio.create_task(archive_idle_conversations())
+    # Keep the context cache alive past CACHE_TTL while the server runs.
+    if settings.CONTEXT_MODE == "cache":
+        asyncio.create_task(refresh_context_cache())
+    if settings.MONGO_WRITE_BEHIND:
+        from app.services.write_buffer import turn_writes
+        from app.services.message_store import bucket_writes
+        from app.services.token_analytics import rollup_writes
+        asyncio.create_task(turn_writes.run())
+        asyncio.create_task(bucket_writes.run())
+        asyncio.create_task(rollup_writes.run())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Persist any turns still waiting in the write-behind buffer.
+    if settings.MONGO_WRITE_BEHIND:
+        from app.services.write_buffer import turn_writes
+        from app.services.message_store import bucket_writes
+        from app.services.token_analytics import rollup_writes
+        await asyncio.gather(turn_writes.flush(), bucket_writes.flush(), rollup_writes.flush())
+    # Persist request counts admitted since the last sync.
+    if settings.ADMISSION_ENABLED:
+        await admission.sync()
+
+async def warm_up():
+    # MongoDB, the document indexes and the context cache warm up concurrently.
+    gemini_client = GeminiClient()
+    # One read of the document, shared by the indexes and the context cache if one has to be created.
+    document_text = asyncio.create_task(telemetry.to_thread(gemini_client.load_document_text))
+    steps = [
+        retry_step("mongo", warm_up_mongo(), warm_up_mongo),
+        retry_step("document", index_document(gemini_client, document_text), lambda: index_document(gemini_client)),
+    ]
+    if settings.CONTEXT_MODE == "cache":
+        steps.append(retry_step("context_cache", gemini_client.initialize_cache(document_text), gemini_client.initialize_cache))
+    await asyncio.gather(*steps)
+
+async def retry_step(name: str, first_attempt, retry):
+    # Runs a warm-up step until it succeeds; retry() makes the awaitable of each later attempt.
+    if await readiness.run_step(name, first_attempt):
+        return
+    while True:
+        await asyncio.sleep(settings.WARMUP_RETRY_INTERVAL)
+        if await readiness.run_step(name, retry()):
+            return
+
+async def warm_up_mongo():
+    # Open the connection pool before the first request needs it, create the
+    # indexes, then migrate legacy inline message arrays into bucket documents
+    # in the background.
+    from app.services.mongodb import MongoDBClient
+    from app.services import message_store
+    db = MongoDBClient.get_database()
+    await db.command("ping")
+    await MongoDBClient.ensure_indexes()
+    asyncio.create_task(message_store.migrate_all_inline_messages(db))
+
+async def index_document(gemini_client: GeminiClient, document_text=None):
+    document_text = await (document_text or telemetry.to_thread(gemini_client.load_document_text))
+    # Index the document's FAQ pairs so close matches skip the model round trip.
+    if settings.FAQ_INDEX_ENABLED:
+        from app.services.faq_index import build_faq_index
+        await telemetry.to_thread(build_faq_index, document_text)
+    # Index the document's sections for retrieval mode, which is also the
+    # fallback when the context cache is missing or expired.
+    from app.services.retrieval import build_section_index
+    await telemetry.to_thread(build_section_index, document_text)
+    # Only used to report retrieval-mode savings, so readiness does not wait for it.
+    asyncio.create_task(count_document_tokens(gemini_client, document_text))
+
+async def count_document_tokens(gemini_client: GeminiClient, document_text: str):
+    try:
+        await gemini_client.count_document_tokens(document_text)
+    except Exception as e:
+        log_event("document_token_count_failed", logging.ERROR, error=str(e))
 
 async def cleanup_chat_sessions():
     from app.services.chat_session_manager import ChatSessionManager
     while True:
         await ChatSessionManager.cleanup_sessions()
-        await asyncio.sleep(60)  # cleanup interval
+        await asyncio.sleep(settings.SESSION_SWEEP_INTERVAL)  # cleanup interval
+
+async def archive_idle_conversations():
+    from app.services import archive
+    while True:
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL)
+        try:
+            # Full passes mean more idle conversations are waiting.
+            while await archive.archive_idle_conversations() == settings.ARCHIVE_BATCH_SIZE:
+                await asyncio.sleep(0)
+        except Exception as e:
+            log_event("archive_failed", logging.ERROR, error=str(e))
+
+async def refresh_context_cache():
+    gemini_client = GeminiClient()
+    while True:
+        await asyncio.sleep(settings.CACHE_REFRESH_INTERVAL)
+        try:
+            await gemini_client.refresh_cache()
+        except Exception as e:
+            log_event("context_cache_refresh_failed", logging.ERROR, error=str(e))
 
 @app.get("/")
 def root():
     return {"message": "Welcome to BEMO Bank Chatbot API"}
 
 if __name__ == "__main__":
+    import multiprocessing
+    # In the PyInstaller build, lets spawned ingestion workers run their task
+    # instead of starting the server again.
+    multiprocessing.freeze_support()
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
@@ -3,25 +3,48 @@ from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class Message(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")  # Also the cursor for paginating history
     role: str
     content: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     token_count: Optional[int] = None
+    prompt_token_count: Optional[int] = None  # Prompt tokens of the turn this model message answered
+    cached: bool = False  # True when the answer came from the answer cache
+    faq_score: Optional[float] = None  # Match score when answered from the FAQ index
+    coalesced: bool = False  # True when the answer was shared from an identical concurrent question
+
+    class Config:
+        populate_by_name = True
 
 class Conversation(BaseModel):
     id: Optional[str] = Field(default=None, alias="_id")
     user_id: str
-    messages: List[Message] = []
+    messages: List[Message] = []  # Kept for compatibility; messages are stored in message buckets
+    message_count: int = 0
+    document: Optional[str] = None  # Context document (a CONTEXT_DOCUMENTS name); the default document when unset
     start_time: datetime = Field(default_factory=datetime.utcnow)
     last_message_time: datetime = Field(default_factory=datetime.utcnow)
 
     class Config:
         populate_by_name = True
 
+class ConversationSummary(BaseModel):
+    id: str = Field(alias="_id")
+    user_id: str
+    start_time: datetime
+    last_message_time: datetime
+    message_count: int = 0
+    total_token_count: int = 0
+
+    class Config:
+        populate_by_name = True
+
 class ContextCacheInfo(BaseModel):
     name: str
     model: str
     display_name: str
     create_time: str
     update_time: str
-    expire_time: str
\ No newline at end of file
+    expire_time: str
+    age_seconds: Optional[float] = None
+    remaining_ttl_seconds: Optional[float] = None
\ No newline at end of file
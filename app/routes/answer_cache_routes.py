@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from app.services.answer_cache import answer_cache
+from app.services.single_flight import first_turn_flights
+
+router = APIRouter()
+
+@router.get("/answer-cache/stats")
+async def get_answer_cache_stats():
+    return answer_cache.stats()
+
+@router.get("/answer-cache/coalescing")
+async def get_coalescing_stats():
+    # Identical concurrent first-turn questions that shared one Gemini call.
+    return first_turn_flights.stats()
+
+@router.delete("/answer-cache")
+async def clear_answer_cache():
+    answer_cache.clear()
+    return {"message": "Answer cache cleared."}
@@ -2,6 +2,7 @@ import time
 from fastapi import APIRouter
 from app.config import settings
 from app.services.chat_session_manager import ChatSessionManager
+from app.services.admission import admission
 
 router = APIRouter()
 
@@ -23,3 +24,14 @@ def get_active_chat_sessions():
             "remaining_duration": remaining_duration  # in seconds
         })
     return sessions_info
+
+@router.get("/chat-sessions/metrics")
+def get_chat_session_metrics():
+    # Session count, eviction/expiry counters, sweep timing and estimated memory use.
+    return ChatSessionManager.metrics()
+
+
+@router.get("/chat-sessions/admission")
+def get_admission_stats():
+    # Requests admitted and rejected by the per-user quota.
+    return admission.stats()
\ No newline at end of file
@@ -1,19 +1,18 @@
-import os
-import asyncio
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response
 from typing import List
 from app.models import ContextCacheInfo
 from app.services.gemini_client import GeminiClient
+from app.services.context_caches import age_seconds, remaining_seconds
+from app.services.retrieval import retrieval_stats
 from app.config import settings
 
 router = APIRouter()
 
 @router.get("/context-cache/info", response_model=ContextCacheInfo)
-async def get_context_cache_info():
-    gemini_client = GeminiClient()
-    if not gemini_client.cache:
+async def get_context_cache_info(document: str = Query(None, description="A CONTEXT_DOCUMENTS name; the default document when unset.")):
+    cache = GeminiClient().contexts.get(document)
+    if not cache:
         raise HTTPException(status_code=404, detail="No cached content found.")
-    cache = gemini_client.cache
     return ContextCacheInfo(
         name=cache.name,
         model=cache.model,
@@ -21,21 +20,52 @@ async def get_context_cache_info():
         create_time=str(cache.create_time),
         update_time=str(cache.update_time),
         expire_time=str(cache.expire_time),
+        age_seconds=age_seconds(cache),
+        remaining_ttl_seconds=remaining_seconds(cache),
     )
 
-@router.get("/context-cache/list", response_model=List[ContextCacheInfo])
-async def list_context_caches():
+@router.get("/context-cache/lifecycle")
+async def get_context_cache_lifecycle():
+    # TTL extensions and replacements done by the background refresh task.
     gemini_client = GeminiClient()
-    # Call the caches.list() method using the underlying client.
-    def list_caches():
-        # List caches for the specified model. Adjust this if your API requires different parameters.
-        return gemini_client.client.caches.list()
-    
-    caches_list = await asyncio.to_thread(list_caches)
-    
-    if not caches_list:
+    return {
+        "name": gemini_client.cache.name if gemini_client.cache else None,
+        "age_seconds": gemini_client.cache_age_seconds(),
+        "remaining_ttl_seconds": gemini_client.cache_remaining_seconds(),
+        "refresh_margin_seconds": settings.CACHE_REFRESH_MARGIN,
+        **gemini_client.cache_lifecycle,
+    }
+
+@router.get("/context-cache/registry")
+async def get_context_cache_registry():
+    # Caches held by this worker, most recently used first, with their remaining TTL.
+    return GeminiClient().contexts.stats()
+
+@router.post("/context-cache/refresh")
+async def refresh_context_caches(force: bool = Query(False, description="Extend every held cache, not only those close to expiry.")):
+    refreshed = await GeminiClient().contexts.refresh_all(force=force)
+    return {"refreshed": refreshed}
+
+@router.get("/context-cache/retrieval-stats")
+async def get_retrieval_stats():
+    # Prompt tokens spent in retrieval mode and the estimated savings over binding the full cache.
+    stats = retrieval_stats.summary()
+    stats["active"] = GeminiClient().use_retrieval()
+    return stats
+
+@router.get("/context-cache/list", response_model=List[ContextCacheInfo])
+async def list_context_caches(
+    response: Response,
+    page_size: int = Query(100, ge=1, le=1000),
+    page_token: str = Query(None, description="The X-Next-Page-Token header of the previous page."),
+):
+    # One page of the project's caches; the next page's token is returned in X-Next-Page-Token.
+    caches_list, next_page_token = await GeminiClient().contexts.list_page(page_size, page_token)
+    if not caches_list and not page_token:
         raise HTTPException(status_code=404, detail="No cached contents found.")
-    
+    if next_page_token:
+        response.headers["X-Next-Page-Token"] = next_page_token
+
     # Convert each cache object to our Pydantic model.
     result = []
     for cache in caches_list:
@@ -53,25 +83,7 @@ async def list_context_caches():
 
 @router.delete("/context-cache")
 async def delete_all_caches():
-    gemini_client = GeminiClient()
-    
-    def list_and_delete():
-        # List all cached content metadata
-        caches_list = gemini_client.client.caches.list()
-        deleted_count = 0
-        for cache in caches_list:
-            try:
-                # Delete each cache using its name
-                gemini_client.client.caches.delete(name=cache.name)
-                deleted_count += 1
-            except Exception as e:
-                print(f"Error deleting cache {cache.name}: {e}")
-        return deleted_count
-
-    deleted_count = await asyncio.to_thread(list_and_delete)
-    
-    # Optionally remove local metadata file if it exists
-    # if os.path.exists(CACHE_METADATA_FILE):
-    #    os.remove(CACHE_METADATA_FILE)
-    
-    return {"message": f"Deleted {deleted_count} cache object(s)."}
\ No newline at end of file
+    # Deletes run concurrently (at most CONTEXT_CACHE_ADMIN_PARALLELISM) while further pages are listed.
+    # The held caches and their saved metadata are forgotten; turns fall back to retrieval.
+    deleted_count = await GeminiClient().contexts.delete_all()
+    return {"message": f"Deleted {deleted_count} cache object(s)."}
@@ -1,22 +1,74 @@
-from fastapi import APIRouter, HTTPException, Query
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from bson import ObjectId
-from app.models import Conversation, Message  # ✅ Ensure Message is imported
+from app.models import Conversation, ConversationSummary, Message  # ✅ Ensure Message is imported
 from app.services.mongodb import MongoDBClient
 from app.services.chat_session_manager import ChatSessionManager, ChatSession
-from app.services.gemini_client import GeminiClient
+from app.services.gemini_client import GeminiClient, get_token_counts
+from app.services.context_caches import is_default_document
+from app.services.answer_cache import answer_cache, normalize_question
+from app.services.single_flight import first_turn_flights
+from app.services.admission import admission
+from app.services.telemetry import timed, log_event
+from app.services import faq_index as faq
+from app.services.write_buffer import turn_writes
+from app.services import message_store
+from app.services import token_analytics
+from app.services.serialization import FastJSONResponse, ndjson_line, message_fields
+from app.config import settings
 
 router = APIRouter()
-db = MongoDBClient.get_database()
+
+# Fields returned by the conversation listing; message bodies are never shipped.
+SUMMARY_PROJECTION = {
+    "user_id": 1,
+    "start_time": 1,
+    "last_message_time": 1,
+    "message_count": 1,
+    "total_token_count": 1,
+}
+
+# Conversation fields of an export; inline messages are only counted.
+EXPORT_PROJECTION = {
+    "user_id": 1,
+    "document": 1,
+    "start_time": 1,
+    "last_message_time": 1,
+    "message_count": 1,
+    "total_prompt_tokens": 1,
+    "total_response_tokens": 1,
+    "total_token_count": 1,
+    "gemini_turn_count": 1,
+    "archived": 1,
+    "inline_message_count": {"$size": {"$ifNull": ["$messages", []]}},
+}
+
+# Seconds between checks for a disconnected client while waiting on Gemini.
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Turns of interrupted streams still being saved.
+background_tasks = set()
 
 @router.post("/conversations", response_model=Conversation)
 async def create_conversation(conversation: Conversation):
-    # ✅ Check if the user already has an active session in RAM
-    existing_session = ChatSessionManager.get_session(conversation.user_id)
+    # ✅ Reject users over their request quota before touching MongoDB
+    await admission.admit(conversation.user_id, count=False)
+    # ✅ The conversation's context document must be configured
+    if not GeminiClient().contexts.has_document(conversation.document):
+        raise HTTPException(status_code=400, detail=f"Unknown context document: {conversation.document}")
+
+    db = MongoDBClient.get_database()
+    # ✅ Check if the user already has an active session, on this worker or in the shared session store
+    existing_conversation_id = await ChatSessionManager.find_conversation_id(conversation.user_id)
     
-    if existing_session:
+    if existing_conversation_id:
         # ✅ Retrieve the existing conversation from MongoDB
-        existing_conversation = await db.conversations.find_one({"_id": ObjectId(existing_session.conversation_id)})
+        existing_conversation = await timed("mongo_find_one", db.conversations.find_one(
+            {"_id": ObjectId(existing_conversation_id)}, {"messages": 0}
+        ))
         if existing_conversation:
             # Convert `_id` from ObjectId to string and remove `_id` to avoid validation issues
             existing_conversation["id"] = str(existing_conversation["_id"])
@@ -27,101 +79,356 @@ async def create_conversation(conversation: Conversation):
     # ✅ If no active session, create a new conversation
     conversation.start_time = datetime.utcnow()
     conversation.last_message_time = conversation.start_time
-    conversation.messages = []  # Ensure messages are initialized
+    conversation.messages = []  # Messages live in message buckets, see message_store
+    conversation.message_count = 0
 
     # ✅ Insert the conversation into MongoDB
-    result = await db.conversations.insert_one(conversation.dict(by_alias=True, exclude_none=True))
+    result = await db.conversations.insert_one(conversation.dict(by_alias=True, exclude_none=True, exclude={"messages"}))
     
     # ✅ Convert ObjectId to string for JSON response
     conversation.id = str(result.inserted_id)
     
-    # ✅ Create a chat session in RAM
-    ChatSessionManager.create_session(conversation.user_id, conversation.id)
+    # ✅ Create a chat session in RAM (replacing any stale one) and register it in the session store
+    ChatSessionManager.remove_session(conversation.user_id)
+    await ChatSessionManager.start_session(conversation.user_id, conversation.id, conversation.document)
     
     return conversation
 
-@router.post("/conversations/{conversation_id}/messages", response_model=Message)
-async def send_message(conversation_id: str, payload: dict):
+async def start_turn(conversation_id: str, payload: dict):
     # Expected payload: {"user_id": "<user>", "message": "<message text>"}
     user_id = payload.get("user_id")
     message_text = payload.get("message")
     if not user_id or not message_text:
         raise HTTPException(status_code=400, detail="user_id and message are required.")
+    # Count the request against the user's quota before any other I/O.
+    await admission.admit(user_id)
 
-    # Retrieve conversation from the database.
-    conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id)})
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found.")
-
-    # Get or create a chat session.
+    db = MongoDBClient.get_database()
+    # A live session bound to this conversation proves it exists; otherwise
+    # check with an _id-only projection instead of loading the messages.
     chat_session = ChatSessionManager.get_session(user_id)
-    if not chat_session:
-        chat_session = ChatSessionManager.create_session(user_id, conversation_id)
-    
-    chat_session.increment_request_count()
-    chat_session.update_last_message_time()
+    if not chat_session or chat_session.conversation_id != conversation_id:
+        conversation = await timed("mongo_find_one", db.conversations.find_one({"_id": ObjectId(conversation_id)}, {"_id": 1}))
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found.")
 
-    # Save the user's message.
+    # Get or create a chat session; a worker without a live chat rebuilds it
+    # from the persisted messages.
+    chat_session = await ChatSessionManager.get_or_create_session(user_id, conversation_id)
+
+    # The user's message is saved together with the model's reply in save_turn.
     user_message = {
+        "_id": ObjectId(),
         "role": "user",
         "content": message_text,
         "timestamp": datetime.utcnow()
     }
-    await db.conversations.update_one(
-        {"_id": ObjectId(conversation_id)},
-        {"$push": {"messages": user_message}, "$set": {"last_message_time": datetime.utcnow()}}
-    )
-    
-    # Asynchronously send the message to Gemini.
-    gemini_client = GeminiClient()
-    response, prompt_tokens, response_tokens, total_tokens = await gemini_client.send_message(chat_session, message_text)
+    return chat_session, message_text, user_message
 
-    # ✅ Log token counts for debugging
-    print(f"Token Usage - Prompt: {prompt_tokens}, Response: {response_tokens}, Total: {total_tokens}")
+async def save_turn(conversation_id: str, user_id: str, user_message: dict, content: str, prompt_tokens: int, response_tokens: int, total_tokens: int, extra_fields: dict = None, model: str = None):
+    # ✅ Log token counts of the turn
+    log_event(
+        "turn_saved", conversation_id=conversation_id, prompt_tokens=prompt_tokens,
+        response_tokens=response_tokens, total_tokens=total_tokens, **(extra_fields or {}),
+    )
 
     # Save model's response with token counts
     model_message = {
+        "_id": ObjectId(),
         "role": "model",
-        "content": response.text,
+        "content": content,
         "timestamp": datetime.utcnow(),
-        "token_count": response_tokens
+        "token_count": response_tokens,
+        "prompt_token_count": prompt_tokens
     }
-    await db.conversations.update_one(
-        {"_id": ObjectId(conversation_id)},
-        {
-            "$push": {"messages": model_message},
-            "$set": {"last_message_time": datetime.utcnow()},
-            "$inc": {
-                "total_prompt_tokens": prompt_tokens,
-                "total_response_tokens": response_tokens,
-                "total_token_count": total_tokens
-            }
+    if extra_fields:
+        # e.g. {"cached": True} or {"faq_score": 0.93} for turns answered without Gemini
+        model_message.update(extra_fields)
+    # The user and model messages are pushed atomically into one message bucket,
+    # while the conversation document only gets its counters updated.
+    update = {
+        "$set": {"last_message_time": datetime.utcnow()},
+        # A resumed archived conversation can be archived again once it is idle.
+        "$unset": {"archived_at": ""},
+        "$inc": {
+            "message_count": 2,
+            "total_prompt_tokens": prompt_tokens,
+            "total_response_tokens": response_tokens,
+            "total_token_count": total_tokens,
+            "gemini_turn_count": 0 if extra_fields else 1
         }
+    }
+    if not extra_fields:
+        # Per-turn prompt tokens show the effect of the history policy.
+        update["$set"]["last_turn_prompt_tokens"] = prompt_tokens
+        update["$max"] = {"max_turn_prompt_tokens": prompt_tokens}
+    db = MongoDBClient.get_database()
+    if settings.MONGO_WRITE_BEHIND:
+        save_counters = turn_writes.add({"_id": ObjectId(conversation_id)}, update)
+    else:
+        save_counters = timed("mongo_update_one_conversation", db.conversations.update_one({"_id": ObjectId(conversation_id)}, update))
+    # The user's daily token rollup is updated alongside the conversation counters.
+    await asyncio.gather(
+        save_counters,
+        message_store.append_messages(db, ObjectId(conversation_id), [user_message, model_message]),
+        token_analytics.record_turn(user_id, prompt_tokens, response_tokens, total_tokens, gemini_turn=not extra_fields, model=model),
     )
-    
-    return model_message
+    return message_store.serialize_message(model_message)
+
+def lookup_local_answer(gemini_client: GeminiClient, chat_session: ChatSession, first_turn: bool, message_text: str):
+    # Returns (answer, extra message fields) when the turn can be answered without
+    # Gemini, from the answer cache or the FAQ index; otherwise (None, None).
+    answer = extra_fields = None
+    context_name = gemini_client.context_name(chat_session.document)
+    # Cached answers are first-turn answers (see store_answer), so they only serve first turns.
+    if settings.ANSWER_CACHE_ENABLED and first_turn and context_name:
+        answer = answer_cache.get(context_name, message_text)
+        extra_fields = {"cached": True}
+    # The FAQ index is built from the default document.
+    if answer is None and settings.FAQ_INDEX_ENABLED and faq.faq_index is not None and is_default_document(chat_session.document):
+        match = faq.faq_index.answer(message_text)
+        if match:
+            answer, score = match
+            extra_fields = {"faq_score": score}
+    if answer is None:
+        return None, None
+    if chat_session.chat:
+        gemini_client.record_turn(chat_session, message_text, answer)
+    return answer, extra_fields
+
+def store_answer(gemini_client: GeminiClient, chat_session: ChatSession, first_turn: bool, message_text: str, answer: str):
+    # Only first-turn answers are cached: later answers may depend on the chat history.
+    context_name = gemini_client.context_name(chat_session.document)
+    if settings.ANSWER_CACHE_ENABLED and first_turn and context_name:
+        answer_cache.put(context_name, message_text, answer)
+
+def flight_key(gemini_client: GeminiClient, chat_session: ChatSession, first_turn: bool, message_text: str):
+    # Identical first-turn questions in flight at the same time share one Gemini
+    # call; later turns depend on the chat history and are never coalesced.
+    context_name = gemini_client.context_name(chat_session.document)
+    if settings.SINGLE_FLIGHT_ENABLED and first_turn and context_name:
+        return context_name, normalize_question(message_text)
+    return None
+
+async def cancel_on_disconnect(request: Request, awaitable):
+    # Awaits the Gemini part of a request, cancelling it (and freeing its
+    # scheduler slot or queue place) if the HTTP client disconnects first.
+    task = asyncio.ensure_future(awaitable)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            raise HTTPException(status_code=499, detail="Client disconnected.")
+
+def run_in_background(coroutine):
+    # Keeps a reference to the task until it is done, so it is not garbage collected midway.
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def save_interrupted_turn(chunks, conversation_id: str, user_id: str, user_message: dict, answer: str, prompt_tokens: int, response_tokens: int, total_tokens: int, model: str):
+    # Stops the Gemini stream (freeing its scheduler slot) and saves the part of the answer sent so far.
+    try:
+        await chunks.aclose()
+        await save_turn(conversation_id, user_id, user_message, answer, prompt_tokens, response_tokens, total_tokens, model=model)
+    except Exception as e:
+        log_event("interrupted_turn_save_failed", logging.ERROR, conversation_id=conversation_id, error=str(e))
+
+async def ask_gemini(gemini_client: GeminiClient, chat_session: ChatSession, message_text: str):
+    # Returns (answer, prompt tokens, response tokens, total tokens, extra message fields).
+    first_turn = bool(chat_session.chat) and not chat_session.chat.get_history()
+    summary_tokens = await gemini_client.apply_history_policy(chat_session)
+    key = flight_key(gemini_client, chat_session, first_turn, message_text)
+    if key:
+        result, shared = await first_turn_flights.do(
+            key, lambda: gemini_client.send_message(chat_session, message_text)
+        )
+        response, prompt_tokens, response_tokens, total_tokens = result
+        if shared:
+            # Answered by another conversation's call: record it here, bill nothing.
+            gemini_client.record_turn(chat_session, message_text, response.text)
+            return response.text, 0, 0, 0, {"coalesced": True}
+    else:
+        response, prompt_tokens, response_tokens, total_tokens = await gemini_client.send_message(chat_session, message_text)
+    store_answer(gemini_client, chat_session, first_turn, message_text, response.text)
+    # Tokens spent folding history into a summary are billed to this turn's prompt.
+    return response.text, prompt_tokens + summary_tokens, response_tokens, total_tokens + summary_tokens, None
+
+@router.post("/conversations/{conversation_id}/messages", response_model=Message)
+async def send_message(conversation_id: str, payload: dict, request: Request):
+    chat_session, message_text, user_message = await start_turn(conversation_id, payload)
+    gemini_client = GeminiClient()
+    first_turn = bool(chat_session.chat) and not chat_session.chat.get_history()
+
+    local_answer, extra_fields = lookup_local_answer(gemini_client, chat_session, first_turn, message_text)
+    if local_answer is not None:
+        return await save_turn(conversation_id, chat_session.user_id, user_message, local_answer, 0, 0, 0, extra_fields)
 
+    # Asynchronously send the message to Gemini, unless the client goes away first.
+    answer, prompt_tokens, response_tokens, total_tokens, extra_fields = await cancel_on_disconnect(
+        request, ask_gemini(gemini_client, chat_session, message_text)
+    )
+    return await save_turn(
+        conversation_id, chat_session.user_id, user_message, answer, prompt_tokens, response_tokens, total_tokens, extra_fields,
+        model=gemini_client.document_model(chat_session.document),
+    )
+
+@router.post("/conversations/{conversation_id}/messages/stream")
+async def send_message_stream(conversation_id: str, payload: dict):
+    # Same contract as send_message, but the reply is streamed as NDJSON:
+    # one {"type": "chunk", "content": ...} line per model chunk, then a
+    # final {"type": "message", "message": {...}} line once it is persisted.
+    chat_session, message_text, user_message = await start_turn(conversation_id, payload)
+    gemini_client = GeminiClient()
+    first_turn = bool(chat_session.chat) and not chat_session.chat.get_history()
+
+    local_answer, extra_fields = lookup_local_answer(gemini_client, chat_session, first_turn, message_text)
+    if local_answer is not None:
+        model_message = await save_turn(conversation_id, chat_session.user_id, user_message, local_answer, 0, 0, 0, extra_fields)
+
+        async def stream_local():
+            yield ndjson_line({"type": "chunk", "content": local_answer})
+            yield ndjson_line({"type": "message", "message": model_message})
+
+        return StreamingResponse(stream_local(), media_type="application/x-ndjson")
+
+    # Wait for the first chunk before committing to a 200 so that overload
+    # and Gemini errors still surface as proper HTTP errors.
+    summary_tokens = await gemini_client.apply_history_policy(chat_session)
+    chunks = gemini_client.send_message_stream(chat_session, message_text)
+    first_chunk = await anext(chunks, None)
 
-@router.get("/conversations/user/{user_id}", response_model=list[Conversation])
-async def get_conversations(user_id: str):
-    cursor = db.conversations.find({"user_id": user_id})
-    conversations = []
-    async for conv in cursor:
-        conv["_id"] = str(conv["_id"])
-        conversations.append(Conversation(**conv))
-    return conversations
+    async def relay_chunks():
+        if first_chunk is None:
+            return
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+
+    async def stream_reply():
+        parts = []
+        usage_metadata = None
+        completed = False
+        try:
+            async for chunk in relay_chunks():
+                if chunk.usage_metadata:
+                    usage_metadata = chunk.usage_metadata
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield ndjson_line({"type": "chunk", "content": chunk.text})
+            completed = True
+        finally:
+            if not completed:
+                # The client went away (or Gemini failed) mid-stream. The generator may be
+                # closed inside a cancelled scope, so the partial turn and the tokens already
+                # spent are persisted by a task of their own.
+                prompt_tokens, response_tokens, total_tokens = get_token_counts(usage_metadata)
+                run_in_background(save_interrupted_turn(
+                    chunks, conversation_id, chat_session.user_id, user_message, "".join(parts),
+                    prompt_tokens + summary_tokens, response_tokens, total_tokens + summary_tokens,
+                    gemini_client.document_model(chat_session.document),
+                ))
+
+        answer = "".join(parts)
+        store_answer(gemini_client, chat_session, first_turn, message_text, answer)
+        prompt_tokens, response_tokens, total_tokens = get_token_counts(usage_metadata)
+        model_message = await save_turn(
+            conversation_id, chat_session.user_id, user_message, answer, prompt_tokens + summary_tokens, response_tokens, total_tokens + summary_tokens,
+            model=gemini_client.document_model(chat_session.document),
+        )
+        yield ndjson_line({"type": "message", "message": model_message})
+
+    return StreamingResponse(stream_reply(), media_type="application/x-ndjson")
+
+
+@router.get("/conversations/user/{user_id}", response_model=list[ConversationSummary])
+async def get_conversations(
+    user_id: str,
+    before: datetime = Query(None, description="Only return conversations whose last message is older than this."),
+    limit: int = Query(50, ge=1, le=200),
+):
+    db = MongoDBClient.get_database()
+    # Newest first, served by the (user_id, last_message_time) index. Pass the
+    # last_message_time of the last item as `before` to fetch the next page.
+    query = {"user_id": user_id}
+    if before is not None:
+        query["last_message_time"] = {"$lt": before}
+    cursor = db.conversations.find(query, SUMMARY_PROJECTION).sort("last_message_time", -1).limit(limit)
+    conversations = await cursor.to_list(length=limit)
+    for conv in conversations:
+        conv.setdefault("message_count", 0)
+        conv.setdefault("total_token_count", 0)
+    # Documents straight from Mongo are encoded as-is, without building a ConversationSummary each.
+    return FastJSONResponse(conversations)
 
 @router.get("/conversations/{conversation_id}/history", response_model=list[Message])
-async def get_conversation_history(conversation_id: str, user_id: str):
-    conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id), "user_id": user_id})
+async def get_conversation_history(
+    conversation_id: str,
+    user_id: str,
+    before: str = Query(None, description="Only return messages older than this message id."),
+    limit: int = Query(None, ge=1, le=500, description="Return at most this many of the newest matching messages."),
+):
+    db = MongoDBClient.get_database()
+    # Only legacy conversations still carry an inline messages array; it is moved
+    # into buckets on first read.
+    conversation = await db.conversations.find_one(
+        {"_id": ObjectId(conversation_id), "user_id": user_id}, {"messages": 1, "archived": 1}
+    )
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found.")
-    return conversation.get("messages", [])
+    if "messages" in conversation:
+        await message_store.migrate_inline_messages(db, conversation)
+
+    messages = await message_store.get_messages(
+        db, conversation["_id"], before=ObjectId(before) if before else None, limit=limit,
+        archived=conversation.get("archived", False),
+    )
+    return FastJSONResponse([message_fields(message) for message in messages])
+
+@router.get("/conversations/user/{user_id}/export")
+async def export_conversations(user_id: str):
+    # Streams all of a user's conversations as NDJSON: one {"type": "conversation", ...}
+    # line per conversation, least recently active first, followed by one {"type": "message", ...}
+    # line per message. Both cursors are read in batches of EXPORT_BATCH_SIZE, so
+    # memory stays constant however long the history is.
+    db = MongoDBClient.get_database()
+
+    async def stream_export():
+        conversations = db.conversations.find({"user_id": user_id}, EXPORT_PROJECTION).sort("last_message_time", 1)
+        async for conversation in conversations.batch_size(settings.EXPORT_BATCH_SIZE):
+            if conversation.pop("inline_message_count"):
+                # Legacy inline messages are moved into buckets first, as on a history read.
+                await message_store.migrate_inline_messages(db, await db.conversations.find_one({"_id": conversation["_id"]}))
+            yield ndjson_line({"type": "conversation", "conversation": conversation})
+            archived = conversation.get("archived", False)
+            async for messages in message_store.iter_message_batches(db, conversation["_id"], archived):
+                yield b"".join(
+                    ndjson_line({"type": "message", "conversation_id": conversation["_id"], "message": message_fields(message)})
+                    for message in messages
+                )
+
+    return StreamingResponse(stream_export(), media_type="application/x-ndjson")
 
 @router.get("/conversations/{conversation_id}/token-stats")
 async def get_conversation_token_stats(conversation_id: str, user_id: str = Query(...)):
-    # Fetch the conversation from the database
-    conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id), "user_id": user_id})
+    db = MongoDBClient.get_database()
+    # Fetch only the counters; legacy inline messages are counted server-side with $size.
+    conversation = await db.conversations.find_one(
+        {"_id": ObjectId(conversation_id), "user_id": user_id},
+        {
+            "total_prompt_tokens": 1,
+            "total_response_tokens": 1,
+            "total_token_count": 1,
+            "message_count": 1,
+            "gemini_turn_count": 1,
+            "last_turn_prompt_tokens": 1,
+            "max_turn_prompt_tokens": 1,
+            "archived": 1,
+            "inline_message_count": {"$size": {"$ifNull": ["$messages", []]}},
+        },
+    )
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found.")
 
@@ -129,7 +436,9 @@ async def get_conversation_token_stats(conversation_id: str, user_id: str = Quer
     total_user_tokens = conversation.get("total_prompt_tokens", 0)  # Tokens from user messages
     total_model_tokens = conversation.get("total_response_tokens", 0)  # Tokens from model responses
     total_tokens = conversation.get("total_token_count", 0)  # Sum of both
-    message_count = len(conversation.get("messages", []))  # Count the number of messages
+    # Count the number of messages
+    message_count = conversation.get("message_count", 0) + conversation.get("inline_message_count", 0)
+    gemini_turn_count = conversation.get("gemini_turn_count", 0)  # Turns that actually called Gemini
 
     return {
         "conversation_id": conversation_id,
@@ -137,25 +446,11 @@ async def get_conversation_token_stats(conversation_id: str, user_id: str = Quer
         "total_user_tokens": total_user_tokens,
         "total_model_tokens": total_model_tokens,
         "total_tokens": total_tokens,
-        "message_count": message_count
+        "message_count": message_count,
+        "gemini_turn_count": gemini_turn_count,
+        "average_prompt_tokens_per_turn": total_user_tokens / gemini_turn_count if gemini_turn_count else 0,
+        "last_turn_prompt_tokens": conversation.get("last_turn_prompt_tokens", 0),
+        "max_turn_prompt_tokens": conversation.get("max_turn_prompt_tokens", 0),
+        # Archived conversations keep their counters in the conversation document.
+        "archived": conversation.get("archived", False),
     }
-    
-@router.post("/conversations0", response_model=Conversation)
-async def create_conversation(conversation: Conversation):
-    # Ensure the user does not have an active session.
-    existing_session = ChatSessionManager.get_session(conversation.user_id)
-    if existing_session:
-        raise HTTPException(status_code=400, detail="Active chat session already exists for this user.")
-
-    conversation.start_time = datetime.utcnow()
-    conversation.last_message_time = conversation.start_time
-    # Insert the conversation into MongoDB and get its _id.
-    result = await db.conversations.insert_one(conversation.dict(by_alias=True, exclude_none=True))
-    print(result)
-    print(result.inserted_id)
-    conversation.id = str(result.inserted_id)
-    
-    # Now create a chat session and pass the conversation id.
-    ChatSessionManager.create_session(conversation.user_id, conversation.id)
-    
-    return conversation
\ No newline at end of file
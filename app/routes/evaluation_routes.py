@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.config import settings
+from app.services.gemini_client import GeminiClient
+from app.services.evaluation import EvaluationInputError, parse_questions, run_evaluation
+from app.services.serialization import ndjson_line
+
+router = APIRouter()
+
+@router.post("/evaluations")
+async def evaluate_questions(
+    request: Request,
+    concurrency: int = Query(None, ge=1, le=256, description="Gemini calls in flight, default EVALUATION_CONCURRENCY."),
+    document: str = Query(None, description="Context document to answer from, default the bank document."),
+):
+    # Body: a JSON array, NDJSON or one question per line. Streams one NDJSON line
+    # per answered question as it completes, then a summary line.
+    if not GeminiClient().contexts.has_document(document):
+        raise HTTPException(status_code=400, detail=f"Unknown document: {document}")
+    try:
+        questions = parse_questions(await request.body())
+    except EvaluationInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream_results():
+        async for line in run_evaluation(questions, concurrency or settings.EVALUATION_CONCURRENCY, document):
+            yield ndjson_line(line)
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.config import settings
+from app.services import faq_index as faq
+
+router = APIRouter()
+
+@router.get("/faq/search")
+async def search_faq(q: str = Query(...), k: int = Query(3, ge=1, le=20)):
+    # Lets us inspect match scores when tuning FAQ_MATCH_THRESHOLD.
+    if faq.faq_index is None:
+        raise HTTPException(status_code=404, detail="FAQ index is not built.")
+    return [
+        {
+            "question": entry.question,
+            "section": entry.section,
+            "kind": entry.kind,
+            "score": score,
+            "above_threshold": score >= settings.FAQ_MATCH_THRESHOLD,
+        }
+        for entry, score in faq.faq_index.search(q, k)
+    ]
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from app.services.gemini_client import GeminiClient
+
+router = APIRouter()
+
+@router.get("/gemini/scheduler")
+async def get_scheduler_metrics():
+    # Queue depth and wait-time histograms, rate limiting and retries of outbound Gemini calls.
+    return GeminiClient().scheduler.metrics()
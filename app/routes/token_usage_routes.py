@@ -0,0 +1,53 @@
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, HTTPException, Query
+from app.services import token_analytics
+
+router = APIRouter()
+
+# Days covered when no start date is given.
+DEFAULT_RANGE_DAYS = 30
+
+def date_range(start: date, end: date) -> tuple[date, date]:
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+    return start, end
+
+@router.get("/token-usage/daily")
+async def get_daily_token_usage(
+    start: date = Query(None, description="First UTC day, default 30 days before end."),
+    end: date = Query(None, description="Last UTC day (inclusive), default today."),
+    user_id: str = Query(None),
+    model: str = Query(None, description='A Gemini model name, or "local" for turns answered without Gemini.'),
+    by_model: bool = Query(False, description="One row per day and model instead of per day."),
+):
+    # Tokens per day, for everyone or one user, from the daily rollups.
+    start, end = date_range(start, end)
+    group_by = ["day", "model"] if by_model else ["day"]
+    return await token_analytics.usage(group_by, start, end, user_id=user_id, model=model)
+
+@router.get("/token-usage/users")
+async def get_token_usage_by_user(
+    start: date = Query(None),
+    end: date = Query(None),
+    model: str = Query(None),
+    limit: int = Query(100, ge=1, le=10000),
+):
+    # Users with the most tokens in the range first.
+    start, end = date_range(start, end)
+    return await token_analytics.usage(
+        ["user_id"], start, end, model=model, sort={"total_tokens": -1, "_id.user_id": 1}, limit=limit
+    )
+
+@router.get("/token-usage/models")
+async def get_token_usage_by_model(start: date = Query(None), end: date = Query(None), user_id: str = Query(None)):
+    start, end = date_range(start, end)
+    return await token_analytics.usage(["model"], start, end, user_id=user_id)
+
+@router.post("/token-usage/rebuild")
+async def rebuild_token_usage(start: date = Query(...), end: date = Query(...)):
+    # Recomputes the rollups of past days from the stored messages (backfill).
+    start, end = date_range(start, end)
+    rollups = await token_analytics.rebuild_rollups(start, end)
+    return {"start": start, "end": end, "rollups": rollups}
@@ -0,0 +1,184 @@
+"""Per-user request quotas, checked before a request does any other I/O.
+
+Each user has a sliding-window counter (the approximation of two fixed
+windows: the current window's count plus the previous window's count weighted
+by how much of it still overlaps the sliding window). Counts are kept in
+memory and admitted requests are added to MongoDB counters, one document per
+user and window, every ADMISSION_SYNC_INTERVAL seconds with an atomic $inc.
+The totals read back include other workers' requests, so limits hold across
+workers and restarts; between syncs a worker only sees its own new requests.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from app.config import settings
+from app.services.mongodb import MongoDBClient
+from app.services.telemetry import log_event
+
+COUNTERS_COLLECTION = "request_counters"
+# Users seen within this many seconds get their shared totals refreshed on every sync.
+RECENT_USER_SECONDS = 600
+
+class AdmissionRejected(Exception):
+    """Raised when a user is over their request quota."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UserCounter:
+    __slots__ = ("window", "current", "previous", "pending", "last_seen")
+
+    def __init__(self, window: int, current: int = 0, previous: int = 0):
+        self.window = window  # Index of the current fixed window
+        self.current = current  # Requests in the current window, as last known from MongoDB plus local ones
+        self.previous = previous  # Requests in the previous window
+        self.pending = 0  # Local requests not yet added to MongoDB
+        self.last_seen = time.monotonic()
+
+def counter_id(user_id: str, window: int) -> str:
+    return f"{user_id}:{window}"
+
+class AdmissionController:
+    def __init__(self, limit: int, window_seconds: int):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._counters: dict[str, UserCounter] = {}
+        self._sync_lock = asyncio.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.loads = 0
+        self.syncs = 0
+
+    @property
+    def collection(self):
+        return MongoDBClient.get_database()[COUNTERS_COLLECTION]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _window(self, now: float) -> tuple[int, float]:
+        # (index of the fixed window containing now, fraction of it elapsed)
+        window, offset = divmod(now, self.window_seconds)
+        return int(window), offset / self.window_seconds
+
+    def _roll(self, counter: UserCounter, window: int):
+        if window == counter.window + 1:
+            counter.previous, counter.current = counter.current, 0
+        elif window > counter.window + 1:
+            counter.previous = counter.current = 0
+        else:
+            return
+        counter.window = window
+        counter.pending = 0  # Unsynced requests of a past window no longer matter
+
+    async def _load(self, user_id: str, window: int) -> UserCounter:
+        # The user's counts of the current and previous windows, for a user this worker has not seen yet.
+        self.loads += 1
+        docs = self.collection.find(
+            {"_id": {"$in": [counter_id(user_id, window), counter_id(user_id, window - 1)]}}, {"count": 1}
+        )
+        counts = {doc["_id"]: doc["count"] async for doc in docs}
+        return UserCounter(
+            window, counts.get(counter_id(user_id, window), 0), counts.get(counter_id(user_id, window - 1), 0)
+        )
+
+    def _estimate(self, counter: UserCounter, elapsed: float) -> float:
+        return counter.current + counter.previous * (1 - elapsed)
+
+    async def admit(self, user_id: str, count: bool = True):
+        """Raise AdmissionRejected if the user is over quota; otherwise count the request if `count`."""
+        if not settings.ADMISSION_ENABLED:
+            return
+        now = time.time()
+        window, elapsed = self._window(now)
+        counter = self._counters.get(user_id)
+        if counter is None:
+            loaded = await self._load(user_id, window)
+            counter = self._counters.setdefault(user_id, loaded)
+        self._roll(counter, window)
+        counter.last_seen = time.monotonic()
+
+        if self._estimate(counter, elapsed) >= self.limit:
+            self.rejected += 1
+            # Roughly when enough of the previous window has slid out, at worst the next window.
+            retry_after = int(self.window_seconds * (1 - elapsed)) + 1
+            raise AdmissionRejected(f"Request limit of {self.limit} per {self.window_seconds}s reached.", retry_after)
+        if count:
+            counter.current += 1
+            counter.pending += 1
+        self.admitted += 1
+
+    async def sync(self):
+        """Add pending local requests to the MongoDB counters and read back the shared
+        totals of recently active users."""
+        async with self._sync_lock:
+            window, _ = self._window(time.time())
+            expires_at = datetime.utcnow() + timedelta(seconds=2 * self.window_seconds)
+            pending = {user_id: c.pending for user_id, c in self._counters.items() if c.pending and c.window == window}
+            if pending:
+                ops = [
+                    UpdateOne(
+                        {"_id": counter_id(user_id, window)},
+                        {"$inc": {"count": requests}, "$setOnInsert": {"user_id": user_id, "expires_at": expires_at}},
+                        upsert=True,
+                    )
+                    for user_id, requests in pending.items()
+                ]
+                for user_id in pending:
+                    self._counters[user_id].pending = 0
+                try:
+                    await self.collection.bulk_write(ops, ordered=False)
+                except Exception as e:
+                    log_event("request_counters_sync_failed", logging.ERROR, users=len(ops), error=str(e))
+                    for user_id, requests in pending.items():
+                        counter = self._counters.get(user_id)
+                        if counter and counter.window == window:
+                            counter.pending += requests
+                    return
+            recent = time.monotonic() - RECENT_USER_SECONDS
+            active = [
+                user_id for user_id, c in self._counters.items()
+                if c.window == window and (user_id in pending or c.last_seen >= recent)
+            ]
+            if active:
+                ids = [counter_id(user_id, window) for user_id in active]
+                try:
+                    async for doc in self.collection.find({"_id": {"$in": ids}}, {"user_id": 1, "count": 1}):
+                        counter = self._counters.get(doc["user_id"])
+                        if counter and counter.window == window:
+                            # Shared total, plus requests admitted here since the $inc.
+                            counter.current = doc["count"] + counter.pending
+                except Exception as e:
+                    # The local counts stand until the next sync reads the shared totals.
+                    log_event("request_counters_read_failed", logging.ERROR, users=len(ids), error=str(e))
+            self.syncs += 1
+
+            # Forget users idle for a whole window; they are reloaded from MongoDB when they return.
+            idle_before = time.monotonic() - self.window_seconds
+            for user_id in [u for u, c in self._counters.items() if c.last_seen < idle_before and not c.pending]:
+                del self._counters[user_id]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.ADMISSION_SYNC_INTERVAL)
+            try:
+                await self.sync()
+            except Exception as e:
+                log_event("request_counters_sync_failed", logging.ERROR, error=str(e))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.ADMISSION_ENABLED,
+            "limit": self.limit,
+            "window_seconds": self.window_seconds,
+            "tracked_users": len(self._counters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "loads": self.loads,
+            "syncs": self.syncs,
+        }
+
+admission = AdmissionController(settings.MAX_REQUESTS_PER_DAY, settings.ADMISSION_WINDOW)
@@ -0,0 +1,86 @@
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from app.config import settings
+
+# Arabic harakat, tanween, shadda, sukun, superscript alef and tatweel.
+ARABIC_DIACRITICS = re.compile("[\u064B-\u0652\u0670\u0640]")
+ARABIC_LETTER_VARIANTS = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ى": "ي",
+    "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+})
+
+def normalize_question(text: str) -> str:
+    # Folds the spelling variations clients use for the same question so they share a key.
+    text = unicodedata.normalize("NFKC", text)
+    text = ARABIC_DIACRITICS.sub("", text)
+    text = text.translate(ARABIC_LETTER_VARIANTS).lower()
+    text = "".join(" " if unicodedata.category(ch).startswith(("P", "S")) else ch for ch in text)
+    return " ".join(text.split())
+
+class AnswerCache:
+    """LRU + TTL cache of model answers keyed on the context name and the normalized question.
+
+    Answers are only shared within one context (a context cache or retrieval
+    mode); entries of a context no longer in use age out of the LRU.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[str, str], tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, cache_name: str, question: str):
+        key = (cache_name, normalize_question(question))
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        answer, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return answer
+
+    def put(self, cache_name: str, question: str, answer: str):
+        key = (cache_name, normalize_question(question))
+        if not key[1] or not answer:
+            return
+        self._entries[key] = (answer, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.ANSWER_CACHE_ENABLED,
+            "contexts": len({cache_name for cache_name, _ in self._entries}),
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+answer_cache = AnswerCache(settings.ANSWER_CACHE_MAX_SIZE, settings.ANSWER_CACHE_TTL)
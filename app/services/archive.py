@@ -0,0 +1,105 @@
+"""Archival of idle conversations' messages into compressed chunks.
+
+A background sweep picks conversations whose last message is older than
+ARCHIVE_AFTER and moves each of their message buckets into one archive chunk,
+with the messages BSON-encoded and zlib-compressed:
+
+    {"_id": <bucket _id>, "conversation_id": ObjectId, "user_id": str,
+     "first_id": ObjectId, "last_id": ObjectId, "count": int,
+     "archived_at": datetime, "messages": bytes}
+
+The conversation document stays in the conversations collection as the
+summary stub: metadata and token counters, plus "archived" (it has archive
+chunks), "archived_at" and "archived_message_count". message_store.get_messages
+reads the chunks of archived conversations transparently, so history, session
+rebuilds and exports do not change. A new turn unsets "archived_at", so a
+resumed conversation is archived again once it is idle.
+"""
+import zlib
+from datetime import datetime, timedelta
+import bson
+from pymongo import ASCENDING
+from app.config import settings
+from app.services.mongodb import MongoDBClient
+from app.services.message_store import BUCKETS_COLLECTION, migrate_inline_messages
+from app.services.telemetry import STAGE_SECONDS, log_event
+
+ARCHIVE_COLLECTION = "message_archive"
+
+async def ensure_indexes():
+    db = MongoDBClient.get_database()
+    await db[ARCHIVE_COLLECTION].create_index([("conversation_id", ASCENDING), ("first_id", ASCENDING)])
+    await db[ARCHIVE_COLLECTION].create_index([("conversation_id", ASCENDING), ("last_id", ASCENDING)])
+    # Idle conversations not archived since their last turn, oldest first
+    # (archived_at is null until archived, and again after a new turn).
+    await db.conversations.create_index([("archived_at", ASCENDING), ("last_message_time", ASCENDING)])
+
+def compress_messages(messages: list[dict]) -> bytes:
+    # BSON keeps ObjectIds and datetimes as they are stored in the buckets.
+    return zlib.compress(bson.encode({"messages": messages}), settings.ARCHIVE_COMPRESSION_LEVEL)
+
+def decompress_messages(payload: bytes) -> list[dict]:
+    return bson.decode(zlib.decompress(payload))["messages"]
+
+def archive_chunk(bucket: dict, user_id: str, now: datetime) -> dict:
+    return {
+        "conversation_id": bucket["conversation_id"],
+        "user_id": user_id,
+        "first_id": bucket["first_id"],
+        "last_id": bucket["last_id"],
+        "count": len(bucket["messages"]),
+        "archived_at": now,
+        "messages": compress_messages(bucket["messages"]),
+    }
+
+async def archive_conversation(db, conversation: dict, now: datetime = None) -> int:
+    """Move the conversation's message buckets into archive chunks and return
+    how many messages were archived.
+
+    Each chunk is written before its bucket is deleted, and a bucket is only
+    deleted if no message was pushed into it meanwhile; otherwise its chunk is
+    dropped again and the bucket stays hot. Readers skip the messages of a
+    chunk whose bucket still exists.
+    """
+    now = now or datetime.utcnow()
+    if "messages" in conversation:
+        await migrate_inline_messages(db, conversation)
+    archived = 0
+    async for bucket in db[BUCKETS_COLLECTION].find({"conversation_id": conversation["_id"]}):
+        await db[ARCHIVE_COLLECTION].replace_one(
+            {"_id": bucket["_id"]}, archive_chunk(bucket, conversation["user_id"], now), upsert=True
+        )
+        result = await db[BUCKETS_COLLECTION].delete_one({"_id": bucket["_id"], "count": bucket["count"]})
+        if not result.deleted_count:
+            await db[ARCHIVE_COLLECTION].delete_one({"_id": bucket["_id"]})
+            continue
+        archived += len(bucket["messages"])
+    await db.conversations.update_one({"_id": conversation["_id"]}, {"$inc": {"archived_message_count": archived}})
+    return archived
+
+async def archive_idle_conversations(now: datetime = None) -> int:
+    """Archive up to ARCHIVE_BATCH_SIZE conversations idle for more than
+    ARCHIVE_AFTER seconds and return how many were archived.
+
+    A conversation is claimed by setting its archived_at first, so concurrent
+    sweeps on other workers never archive the same one.
+    """
+    db = MongoDBClient.get_database()
+    now = now or datetime.utcnow()
+    idle = {"archived_at": None, "last_message_time": {"$lt": now - timedelta(seconds=settings.ARCHIVE_AFTER)}}
+    candidates = await db.conversations.find(idle, {"_id": 1}).sort("last_message_time", ASCENDING).limit(
+        settings.ARCHIVE_BATCH_SIZE
+    ).to_list(length=None)
+    conversations = messages = 0
+    with STAGE_SECONDS.labels("archive_conversations").time():
+        for candidate in candidates:
+            conversation = await db.conversations.find_one_and_update(
+                {"_id": candidate["_id"], **idle}, {"$set": {"archived_at": now, "archived": True}}
+            )
+            if not conversation:
+                continue  # Claimed by another worker, or active again
+            messages += await archive_conversation(db, conversation, now)
+            conversations += 1
+    if conversations:
+        log_event("conversations_archived", conversations=conversations, messages=messages)
+    return conversations
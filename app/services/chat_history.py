@@ -0,0 +1,65 @@
+from google.genai import types
+
+# Rough Arabic/English average used to estimate history size without an API call.
+CHARS_PER_TOKEN = 3
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a BEMO bank client and the bank's assistant. "
+    "Keep every fact the client shared and every product, amount or condition discussed, "
+    "in Arabic, in no more than 150 words.\n\n"
+)
+SUMMARY_PREFIX = "ملخص المحادثة السابقة: "
+SUMMARY_ACK = "حسناً، سأتابع المحادثة بناءً على هذا الملخص."
+
+def content_text(content: types.Content) -> str:
+    return "".join(part.text or "" for part in content.parts or [])
+
+def group_turns(history: list[types.Content]) -> list[list[types.Content]]:
+    # Groups the flat history into turns, each starting with a user content.
+    turns = []
+    for content in history:
+        if content.role == "user" or not turns:
+            turns.append([])
+        turns[-1].append(content)
+    return turns
+
+def flatten_turns(turns: list[list[types.Content]]) -> list[types.Content]:
+    return [content for turn in turns for content in turn]
+
+def estimate_tokens(turn: list[types.Content]) -> int:
+    return sum(len(content_text(content)) for content in turn) // CHARS_PER_TOKEN + 1
+
+def keep_last_turns(turns: list[list[types.Content]], max_turns: int) -> list[list[types.Content]]:
+    return turns[-max_turns:] if max_turns > 0 else []
+
+def keep_within_budget(turns: list[list[types.Content]], token_budget: int) -> list[list[types.Content]]:
+    # Keeps the most recent turns whose estimated size fits the budget.
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        used += estimate_tokens(turn)
+        if used > token_budget:
+            break
+        kept.append(turn)
+    return kept[::-1]
+
+def transcript(turns: list[list[types.Content]]) -> str:
+    return "\n".join(f"{content.role}: {content_text(content)}" for content in flatten_turns(turns))
+
+def summary_turn(summary: str) -> list[types.Content]:
+    # A synthetic turn that carries the summary of the folded-away history.
+    return [
+        types.Content(role="user", parts=[types.Part(text=SUMMARY_PREFIX + summary)]),
+        types.Content(role="model", parts=[types.Part(text=SUMMARY_ACK)]),
+    ]
+
+def contents_from_messages(messages: list[dict]) -> list[types.Content]:
+    # Rebuilds SDK chat history from persisted conversation messages, starting at a user turn.
+    contents = [
+        types.Content(role=message["role"], parts=[types.Part(text=message["content"])])
+        for message in messages
+        if message.get("role") in ("user", "model") and message.get("content")
+    ]
+    while contents and contents[0].role != "user":
+        contents.pop(0)
+    return contents
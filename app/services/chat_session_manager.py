@@ -1,14 +1,26 @@
 # In app/services/chat_session_manager.py
 
+import asyncio
+import heapq
+import sys
 import time
+from collections import OrderedDict
+from bson import ObjectId
 from app.config import settings
 from app.services.gemini_client import GeminiClient
+from app.services.mongodb import MongoDBClient
+from app.services.session_store import session_store
+from app.services import chat_history, message_store
+from app.services.telemetry import ACTIVE_SESSIONS
 
 class ChatSession:
-    def __init__(self, user_id: str, conversation_id: str = None):
+    __slots__ = ("user_id", "conversation_id", "document", "chat", "start_time", "last_message_time", "request_count")
+
+    def __init__(self, user_id: str, conversation_id: str = None, history=None, document: str = None):
         self.user_id = user_id
         self.conversation_id = conversation_id  # This will hold the conversation id if provided.
-        self.chat = GeminiClient().create_chat()
+        self.document = document  # Context document of the conversation; None for the default one
+        self.chat = GeminiClient().create_chat(history=history, document=document)
         # self.chat = None  # Set up your chat session (e.g., via GeminiClient) as needed.
         self.start_time = time.time()
         self.last_message_time = time.time()
@@ -20,20 +32,125 @@ class ChatSession:
     def increment_request_count(self):
         self.request_count += 1
 
+    def expires_at(self) -> float:
+        return self.last_message_time + settings.MAX_DURATION_AFTER_LAST_MESSAGE
+
+    def is_expired(self, now: float) -> bool:
+        return now >= self.expires_at() or self.request_count >= settings.MAX_REQUESTS_PER_DAY
+
+    def estimated_size(self) -> int:
+        # Approximate bytes held by the session: the object itself plus its chat history text.
+        size = sys.getsizeof(self)
+        if self.chat:
+            for content in self.chat.get_history():
+                size += sum(len((part.text or "").encode("utf-8")) for part in content.parts or [])
+        return size
+
 class ChatSessionManager:
-    _sessions: dict[str, ChatSession] = {}
+    # Sessions in least- to most-recently-used order.
+    _sessions: OrderedDict[str, ChatSession] = OrderedDict()
+    # Min-heap of (expires_at, user_id). Entries are not updated when a session is
+    # used; a popped entry whose session has been used since is pushed back with
+    # the session's current expiry.
+    _expiry_heap: list[tuple[float, str]] = []
+    _stats = {
+        "expired": 0,
+        "evicted": 0,
+        "last_sweep_seconds": 0.0,
+        "last_sweep_removed": 0,
+        "last_sweep_time": None,
+    }
 
     @classmethod
-    def create_session(cls, user_id: str, conversation_id: str = None) -> ChatSession:
-        if user_id in cls._sessions:
+    def create_session(cls, user_id: str, conversation_id: str = None, history=None, document: str = None) -> ChatSession:
+        if cls.get_session(user_id):
             raise Exception("User already has an active chat session.")
-        session = ChatSession(user_id, conversation_id)
+        while len(cls._sessions) >= settings.MAX_ACTIVE_SESSIONS:
+            # At capacity: drop the least recently used session.
+            cls._sessions.popitem(last=False)
+            cls._stats["evicted"] += 1
+        session = ChatSession(user_id, conversation_id, history=history, document=document)
         cls._sessions[user_id] = session
+        heapq.heappush(cls._expiry_heap, (session.expires_at(), user_id))
         return session
 
     @classmethod
     def get_session(cls, user_id: str) -> ChatSession:
-        return cls._sessions.get(user_id)
+        session = cls._sessions.get(user_id)
+        if session is None:
+            return None
+        # Expire lazily so a stale session is never handed out between sweeps.
+        if session.is_expired(time.time()):
+            cls.remove_session(user_id)
+            cls._stats["expired"] += 1
+            return None
+        cls._sessions.move_to_end(user_id)
+        return session
+
+    @classmethod
+    async def start_session(cls, user_id: str, conversation_id: str, document: str = None) -> ChatSession:
+        # A new conversation: fresh local chat, registered in the shared store.
+        session = cls.create_session(user_id, conversation_id, document=document)
+        await session_store.create(user_id, conversation_id)
+        return session
+
+    @classmethod
+    async def find_conversation_id(cls, user_id: str):
+        # The conversation of the user's live session, on this worker or any other.
+        session = cls.get_session(user_id)
+        if session:
+            return session.conversation_id
+        shared = await session_store.get(user_id)
+        return shared["conversation_id"] if shared else None
+
+    @classmethod
+    async def load_history(cls, conversation_id: str):
+        # The most recent persisted messages of the conversation as SDK chat history.
+        messages = await message_store.get_messages(
+            MongoDBClient.get_database(), ObjectId(conversation_id), limit=settings.SESSION_REHYDRATE_MESSAGES
+        )
+        return chat_history.contents_from_messages(messages)
+
+    @classmethod
+    async def load_document(cls, conversation_id: str):
+        # The conversation's context document; only looked up when documents other than the default exist.
+        if not settings.CONTEXT_DOCUMENTS:
+            return None
+        conversation = await MongoDBClient.get_database().conversations.find_one(
+            {"_id": ObjectId(conversation_id)}, {"document": 1}
+        )
+        return conversation.get("document") if conversation else None
+
+    @classmethod
+    async def get_or_create_session(cls, user_id: str, conversation_id: str) -> ChatSession:
+        """Return the user's session for a new turn, counting the request.
+
+        The request is counted in the shared store first, so limits hold across
+        workers. When this worker has no live chat for the session, one is
+        rebuilt lazily from the persisted conversation messages.
+        """
+        shared = await session_store.record_request(user_id, conversation_id)
+        session = cls.get_session(user_id)
+        if shared and session and session.conversation_id != shared["conversation_id"]:
+            # Another worker started a new conversation for this user.
+            cls.remove_session(user_id)
+            session = None
+        if session is None:
+            session_conversation_id = shared["conversation_id"] if shared else conversation_id
+            history, document = await asyncio.gather(
+                cls.load_history(session_conversation_id), cls.load_document(session_conversation_id)
+            )
+            session = cls.get_session(user_id) or cls.create_session(
+                user_id, session_conversation_id, history=history, document=document
+            )
+
+        if shared:
+            session.request_count = shared["request_count"]
+            session.update_last_message_time()
+        else:
+            session.increment_request_count()
+            session.update_last_message_time()
+        return session
 
     @classmethod
     def remove_session(cls, user_id: str):
@@ -42,11 +159,43 @@ class ChatSessionManager:
 
     @classmethod
     async def cleanup_sessions(cls):
+        started = time.perf_counter()
         current_time = time.time()
-        to_remove = []
-        for user_id, session in cls._sessions.items():
-            if (session.request_count >= settings.MAX_REQUESTS_PER_DAY) or \
-               (current_time - session.last_message_time > settings.MAX_DURATION_AFTER_LAST_MESSAGE):
-                to_remove.append(user_id)
-        for user_id in to_remove:
-            cls.remove_session(user_id)
+        removed = 0
+        while cls._expiry_heap and cls._expiry_heap[0][0] <= current_time:
+            _, user_id = heapq.heappop(cls._expiry_heap)
+            session = cls._sessions.get(user_id)
+            if session is None:
+                continue  # Already removed or evicted.
+            if current_time >= session.expires_at():
+                cls.remove_session(user_id)
+                removed += 1
+            else:
+                heapq.heappush(cls._expiry_heap, (session.expires_at(), user_id))
+        # Sessions over the request limit are caught lazily by get_session.
+        if len(cls._expiry_heap) > 2 * len(cls._sessions) + 1024:
+            # Drop entries of removed sessions so the heap stays proportional to live sessions.
+            cls._expiry_heap = [(s.expires_at(), user_id) for user_id, s in cls._sessions.items()]
+            heapq.heapify(cls._expiry_heap)
+        cls._stats["expired"] += removed
+        cls._stats["last_sweep_removed"] = removed
+        cls._stats["last_sweep_seconds"] = time.perf_counter() - started
+        cls._stats["last_sweep_time"] = current_time
+
+    @classmethod
+    def metrics(cls) -> dict:
+        sizes = [session.estimated_size() for session in cls._sessions.values()]
+        return {
+            "active_sessions": len(cls._sessions),
+            "max_active_sessions": settings.MAX_ACTIVE_SESSIONS,
+            "expiry_heap_size": len(cls._expiry_heap),
+            "expired_total": cls._stats["expired"],
+            "evicted_total": cls._stats["evicted"],
+            "last_sweep_seconds": cls._stats["last_sweep_seconds"],
+            "last_sweep_removed": cls._stats["last_sweep_removed"],
+            "last_sweep_time": cls._stats["last_sweep_time"],
+            "estimated_bytes_total": sum(sizes),
+            "estimated_bytes_per_session": sum(sizes) / len(sizes) if sizes else 0,
+        }
+
+ACTIVE_SESSIONS.set_function(lambda: len(ChatSessionManager._sessions))
@@ -0,0 +1,383 @@
+"""Registry of the live Gemini context caches.
+
+Caches are keyed by CacheKey(document hash, model, system instruction
+version), so a changed document, another model or an edited system
+instruction each get a cache of their own. Documents are named: "default" is
+the bank document (CACHED_FILE_EXT), more can be listed in CONTEXT_DOCUMENTS
+(e.g. one per language), and a conversation picks one when it is created.
+
+At most CONTEXT_CACHE_MAX_ENTRIES handles are held; beyond that the least
+recently used one is dropped (never the default document's). A dropped cache
+is no longer refreshed and expires with its TTL, so a cache another worker
+still uses is never deleted under it. Metadata of the held caches is saved in
+CACHE_METADATA_FILE, so a restart reuses caches that are still live.
+Operations across many caches (refresh, delete) run concurrently, at most
+CONTEXT_CACHE_ADMIN_PARALLELISM at a time, on top of the Gemini scheduler's
+own limits.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple
+from google.genai import types
+from app.config import settings
+from app.services import ingestion
+from app.services import telemetry
+from app.services.single_flight import SingleFlight
+from app.services.telemetry import CONTEXT_CACHE_EVENTS, log_event
+
+DEFAULT_DOCUMENT = "default"
+CACHE_METADATA_FILE = "cache_metadata.json"
+
+class CacheKey(NamedTuple):
+    document_hash: str
+    model: str
+    instruction_version: str
+
+    def id(self) -> str:
+        return f"{self.document_hash}:{self.model}:{self.instruction_version}"
+
+class Document(NamedTuple):
+    name: str
+    path: pathlib.Path
+    model: str
+
+    @property
+    def file_ext(self) -> str:
+        return self.path.suffix.lstrip(".").lower()
+
+class CacheEntry:
+    __slots__ = ("key", "document", "cache", "last_used")
+
+    def __init__(self, key: CacheKey, document: str, cache):
+        self.key = key
+        self.document = document
+        self.cache = cache
+        self.last_used = time.monotonic()
+
+def is_default_document(name: str) -> bool:
+    return name in (None, DEFAULT_DOCUMENT)
+
+def instruction_version(system_instruction: str) -> str:
+    return hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()[:12]
+
+def model_name(model: str) -> str:
+    # The API reports a cache's model as "models/<name>".
+    return model.removeprefix("models/")
+
+def parse_documents(spec: str) -> dict[str, Document]:
+    # "en=data/info_en.md,pro=data/info.md@gemini-1.5-pro-002" -> {name: Document}
+    documents = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, source = item.partition("=")
+        path, _, model = source.partition("@")
+        if not name or not path:
+            raise ValueError(f"Invalid CONTEXT_DOCUMENTS entry: {item!r} (expected name=path[@model])")
+        documents[name.strip()] = Document(name.strip(), pathlib.Path(path.strip()), model.strip() or settings.GEMINI_MODEL_NAME)
+    return documents
+
+def age_seconds(cache):
+    if not cache or not cache.create_time:
+        return None
+    return (datetime.now(timezone.utc) - cache.create_time).total_seconds()
+
+def remaining_seconds(cache):
+    if not cache or not cache.expire_time:
+        return None
+    return (cache.expire_time - datetime.now(timezone.utc)).total_seconds()
+
+def metadata_is_live(metadata: dict) -> bool:
+    try:
+        return datetime.fromisoformat(metadata["expire_time"]) > datetime.now(timezone.utc)
+    except (KeyError, TypeError, ValueError):
+        return False
+
+def is_live(cache) -> bool:
+    remaining = remaining_seconds(cache)
+    return cache is not None and (remaining is None or remaining > 0)
+
+class ContextCacheRegistry:
+    def __init__(self, gemini_client, system_instruction: str, max_entries: int, parallelism: int):
+        self.gemini = gemini_client
+        self.instruction_version = instruction_version(system_instruction)
+        self.max_entries = max_entries
+        self.metadata_file = CACHE_METADATA_FILE  # None keeps metadata in memory only
+        # Held caches in least- to most-recently-used order.
+        self._entries: OrderedDict[CacheKey, CacheEntry] = OrderedDict()
+        # Document name -> key of the cache of its current version.
+        self._current: dict[str, CacheKey] = {}
+        self._documents = None
+        # Turns that find their document's cache missing share one load or create.
+        self._loads = SingleFlight()
+        self._admin_slots = asyncio.Semaphore(parallelism)
+        self.lifecycle = {
+            "created": 0, "reused": 0, "extended": 0, "replaced": 0, "failed": 0, "evicted": 0,
+            "last_refresh_time": None,
+        }
+
+    def documents(self) -> dict[str, Document]:
+        if self._documents is None:
+            extra = parse_documents(settings.CONTEXT_DOCUMENTS)
+            extra.pop(DEFAULT_DOCUMENT, None)  # The default document is always the bank document
+            self._documents = extra
+        return {DEFAULT_DOCUMENT: self.default_document(), **self._documents}
+
+    def default_document(self) -> Document:
+        return Document(DEFAULT_DOCUMENT, self.gemini.document_path(), settings.GEMINI_MODEL_NAME)
+
+    def document(self, name: str = None) -> Document:
+        if is_default_document(name):
+            return self.default_document()
+        self.documents()
+        if name not in self._documents:
+            raise ValueError(f"Unknown context document: {name}")
+        return self._documents[name]
+
+    def has_document(self, name: str) -> bool:
+        return is_default_document(name) or name in self.documents()
+
+    def current_key(self, document: str = None):
+        return self._current.get(document or DEFAULT_DOCUMENT)
+
+    def get(self, document: str = None):
+        # The held cache of the document's current version (live or not), or None.
+        key = self._current.get(document or DEFAULT_DOCUMENT)
+        entry = self._entries.get(key) if key else None
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        entry.last_used = time.monotonic()
+        return entry.cache
+
+    def put(self, document: str, key: CacheKey, cache):
+        previous = self._current.get(document)
+        if previous is not None and previous != key:
+            # The cache of the document's previous version is no longer refreshed.
+            self._entries.pop(previous, None)
+        self._entries[key] = CacheEntry(key, document, cache)
+        self._entries.move_to_end(key)
+        self._current[document] = key
+        pinned = self._current.get(DEFAULT_DOCUMENT)
+        while len(self._entries) > self.max_entries:
+            evicted = next((k for k in self._entries if k != pinned), None)
+            if evicted is None:
+                break
+            entry = self._entries.pop(evicted)
+            if self._current.get(entry.document) == evicted:
+                del self._current[entry.document]
+            self.lifecycle["evicted"] += 1
+            log_event("context_cache_evicted", name=entry.cache.name, document=entry.document)
+            CONTEXT_CACHE_EVENTS.labels("evicted").inc()
+
+    def clear(self):
+        self._entries.clear()
+        self._current.clear()
+
+    async def ensure(self, document: str = None, document_text=None):
+        """Return a live cache for the document, reusing a held or persisted one or creating it.
+
+        document_text: an awaitable of the document text, used if a cache has to be created.
+        """
+        document = document or DEFAULT_DOCUMENT
+        cache = self.get(document)
+        if is_live(cache):
+            return cache
+        cache, _ = await self._loads.do(document, lambda: self._load(document, document_text))
+        return cache
+
+    def load_text(self, document: Document) -> str:
+        if document.name == DEFAULT_DOCUMENT:
+            return self.gemini.load_document_text()  # Also records the default document's hash
+        return ingestion.load_document(document.path, document.file_ext)[0]
+
+    async def _load(self, name: str, document_text=None):
+        document = self.document(name)
+        document_hash = await telemetry.to_thread(ingestion.file_hash, document.path)
+        key = CacheKey(document_hash, document.model, self.instruction_version)
+
+        # The cache is only reused if it was built from this document version, model and instruction.
+        saved = self.read_metadata()
+        metadata = saved.get(key.id())
+        if metadata is None and any(m.get("document") == name for m in saved.values()):
+            log_event("context_cache_document_changed", document=name)
+            CONTEXT_CACHE_EVENTS.labels("document_changed").inc()
+        elif metadata is not None:
+            try:
+                if metadata_is_live(metadata):
+                    cache = await self.gemini.call(lambda: self.gemini.client.aio.caches.get(name=metadata["name"]))
+                    log_event("context_cache_reused", name=cache.name, document=name)
+                    CONTEXT_CACHE_EVENTS.labels("reused").inc()
+                    self.lifecycle["reused"] += 1
+                    self.put(name, key, cache)
+                    return cache
+                log_event("context_cache_expired", name=metadata["name"], document=name)
+                CONTEXT_CACHE_EVENTS.labels("expired").inc()
+            except Exception as e:
+                log_event("context_cache_get_failed", logging.ERROR, name=metadata.get("name"), error=str(e))
+
+        text = await (document_text or telemetry.to_thread(self.load_text, document))
+        cache = await self.gemini.create_cache(text, model=document.model)
+        log_event("context_cache_created", name=cache.name, document=name)
+        CONTEXT_CACHE_EVENTS.labels("created").inc()
+        self.lifecycle["created"] += 1
+        self.put(name, key, cache)
+        self.save_metadata()
+        return cache
+
+    async def _bounded(self, awaitable):
+        async with self._admin_slots:
+            return await awaitable
+
+    async def refresh(self, entry: CacheEntry, force: bool = False) -> bool:
+        """Keep one cache alive ahead of its expire_time; True if it was extended or replaced.
+
+        Within CACHE_REFRESH_MARGIN seconds of expiry (or always, with `force`)
+        the cache's TTL is extended. If that fails (e.g. the cache was deleted
+        or already expired) a replacement is built from the document as it is
+        now and held under the key of that version. Chats bind their document's current cache on every turn,
+        so sessions move to the new handle on their next message while calls
+        already in flight finish against the old one.
+        """
+        remaining = remaining_seconds(entry.cache)
+        if not force and remaining is not None and remaining > settings.CACHE_REFRESH_MARGIN:
+            return False
+        name = entry.cache.name
+        try:
+            entry.cache = await self.gemini.call(lambda: self.gemini.client.aio.caches.update(
+                name=name,
+                config=types.UpdateCachedContentConfig(ttl=settings.CACHE_TTL),
+            ))
+            self.lifecycle["extended"] += 1
+            log_event("context_cache_extended", name=name, document=entry.document, expire_time=entry.cache.expire_time)
+            CONTEXT_CACHE_EVENTS.labels("extended").inc()
+            return True
+        except Exception as e:
+            log_event("context_cache_extend_failed", logging.WARNING, name=name, document=entry.document, error=str(e))
+        try:
+            document = self.document(entry.document)
+            # The file may have changed since the entry's cache was built.
+            document_hash = await telemetry.to_thread(ingestion.file_hash, document.path)
+            text = await telemetry.to_thread(self.load_text, document)
+            cache = await self.gemini.create_cache(text, model=document.model)
+        except Exception as e:
+            self.lifecycle["failed"] += 1
+            log_event("context_cache_replace_failed", logging.ERROR, document=entry.document, error=str(e))
+            CONTEXT_CACHE_EVENTS.labels("refresh_failed").inc()
+            return False
+        self.put(entry.document, CacheKey(document_hash, document.model, self.instruction_version), cache)
+        self.lifecycle["replaced"] += 1
+        log_event("context_cache_replaced", name=cache.name, document=entry.document)
+        CONTEXT_CACHE_EVENTS.labels("replaced").inc()
+        return True
+
+    async def refresh_all(self, force: bool = False) -> int:
+        # Refreshes every held cache that needs it, concurrently; returns how many were refreshed.
+        entries = list(self._entries.values())
+        refreshed = sum(await asyncio.gather(*(self._bounded(self.refresh(entry, force)) for entry in entries)))
+        if refreshed:
+            self.lifecycle["last_refresh_time"] = datetime.now(timezone.utc)
+            self.save_metadata()
+        return refreshed
+
+    async def list_page(self, page_size: int = None, page_token: str = None):
+        # One page of the project's caches and the token of the next page (None on the last one).
+        config = types.ListCachedContentsConfig(page_size=page_size, page_token=page_token)
+        async with self.gemini.slot():
+            pager = await self.gemini.client.aio.caches.list(config=config)
+        return list(pager.page), pager.config.get("page_token")
+
+    async def delete_all(self) -> int:
+        """Delete every cache of the project and forget the held ones; returns how many were deleted.
+
+        Deletes of one page run while the next page is fetched.
+        """
+        async def delete(cache) -> int:
+            try:
+                await self.gemini.call(lambda: self.gemini.client.aio.caches.delete(name=cache.name))
+                return 1
+            except Exception as e:
+                log_event("context_cache_delete_failed", logging.ERROR, name=cache.name, error=str(e))
+                return 0
+
+        deletes = []
+        page_token = None
+        while True:
+            caches, page_token = await self.list_page(page_token=page_token)
+            deletes.extend(asyncio.ensure_future(self._bounded(delete(cache))) for cache in caches)
+            if not page_token:
+                break
+        deleted = sum(await asyncio.gather(*deletes))
+        self.clear()
+        if self.metadata_file and os.path.exists(self.metadata_file):
+            os.remove(self.metadata_file)
+        return deleted
+
+    def read_metadata(self) -> dict:
+        # Saved caches by key id; a file in the old single-cache format is ignored.
+        if not self.metadata_file or not os.path.exists(self.metadata_file):
+            return {}
+        try:
+            with open(self.metadata_file, "r") as f:
+                return json.load(f).get("caches", {})
+        except Exception as e:
+            log_event("cache_metadata_read_failed", logging.ERROR, error=str(e))
+            return {}
+
+    def save_metadata(self):
+        if not self.metadata_file:
+            return
+        # Other workers' caches that are still live are kept.
+        saved = {key_id: metadata for key_id, metadata in self.read_metadata().items() if metadata_is_live(metadata)}
+        for entry in self._entries.values():
+            cache = entry.cache
+            saved[entry.key.id()] = {
+                "name": cache.name,
+                "model": cache.model,
+                "display_name": cache.display_name,
+                "create_time": str(cache.create_time),
+                "update_time": str(cache.update_time),
+                "expire_time": str(cache.expire_time),
+                "document": entry.document,
+                "document_hash": entry.key.document_hash,
+                "instruction_version": entry.key.instruction_version,
+            }
+        # Write to a temporary file of this process and rename it over the old one,
+        # so a crash, a concurrent reader or another worker saving at the same time
+        # never sees a half-written file.
+        tmp_file = f"{self.metadata_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump({"caches": saved}, f, indent=4)
+            os.replace(tmp_file, self.metadata_file)
+            log_event("cache_metadata_saved", path=self.metadata_file, caches=len(saved))
+        except Exception as e:
+            log_event("cache_metadata_write_failed", logging.ERROR, error=str(e))
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "max_entries": self.max_entries,
+            "instruction_version": self.instruction_version,
+            "documents": sorted(self.documents()),
+            "entries": [
+                {
+                    "document": entry.document,
+                    "current": self._current.get(entry.document) == key,
+                    "name": entry.cache.name,
+                    "model": model_name(entry.key.model),
+                    "document_hash": entry.key.document_hash,
+                    "age_seconds": age_seconds(entry.cache),
+                    "remaining_ttl_seconds": remaining_seconds(entry.cache),
+                    "idle_seconds": now - entry.last_used,
+                }
+                # Most recently used first.
+                for key, entry in reversed(self._entries.items())
+            ],
+            **self.lifecycle,
+        }
@@ -0,0 +1,194 @@
+"""Bulk question evaluation against the current context.
+
+An evaluation sends a batch of questions to Gemini, each on a fresh chat bound
+to the document's current context cache (or retrieval context), with at most
+`concurrency` calls in flight. No conversation, session or per-turn MongoDB
+write is involved: each question is one Gemini call, and the batch adds a
+single token rollup under the user "evaluation" once it finishes.
+
+Results are yielded as they complete, not in input order:
+
+    {"type": "result", "index": int, "id": ..., "question": str, "answer": str,
+     "latency": float, "tokens": {...}, "cost_usd": float, "expected": ..., "error": str}
+
+followed by one {"type": "summary", ...} line with throughput, latency
+percentiles, token totals and the estimated cost of the batch.
+"""
+import asyncio
+import json
+import logging
+import time
+from app.config import settings
+from app.services.chat_session_manager import ChatSession
+from app.services.gemini_client import GeminiClient
+from app.services import token_analytics
+from app.services.telemetry import log_event
+
+# Scheduler user (fair queuing) and token rollup user of evaluation calls.
+EVALUATION_USER_ID = "evaluation"
+TOKENS_PER_PRICE_UNIT = 1_000_000
+
+class EvaluationInputError(ValueError):
+    pass
+
+def parse_questions(body: bytes) -> list[dict]:
+    """Questions of a request body: a JSON array of strings or of objects with
+    "question" (and optionally "id" and "expected"), NDJSON with one such value
+    per line, or plain text with one question per line."""
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise EvaluationInputError("The questions must be UTF-8 encoded.")
+    stripped = text.strip()
+    if stripped.startswith("["):
+        try:
+            items = json.loads(stripped)
+        except json.JSONDecodeError as e:
+            raise EvaluationInputError(f"Invalid JSON array: {e}")
+    elif stripped.startswith("{"):
+        try:
+            items = [json.loads(line) for line in stripped.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise EvaluationInputError(f"Invalid NDJSON: {e}")
+    else:
+        items = [line.strip() for line in stripped.splitlines() if line.strip()]
+
+    questions = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict) or not isinstance(item.get("question"), str) or not item["question"].strip():
+            raise EvaluationInputError(f"Question {index} has no question text.")
+        questions.append({
+            "index": index,
+            "id": item.get("id", index),
+            "question": item["question"].strip(),
+            "expected": item.get("expected"),
+        })
+    if not questions:
+        raise EvaluationInputError("No questions found.")
+    if len(questions) > settings.EVALUATION_MAX_QUESTIONS:
+        raise EvaluationInputError(f"At most {settings.EVALUATION_MAX_QUESTIONS} questions per evaluation.")
+    return questions
+
+def cost_usd(prompt_tokens: int, cached_tokens: int, response_tokens: int) -> float:
+    # Estimated price of a call; prompt tokens read from a context cache are billed at the cached rate.
+    return (
+        (prompt_tokens - cached_tokens) * settings.GEMINI_INPUT_PRICE
+        + cached_tokens * settings.GEMINI_CACHED_INPUT_PRICE
+        + response_tokens * settings.GEMINI_OUTPUT_PRICE
+    ) / TOKENS_PER_PRICE_UNIT
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def evaluate_question(gemini_client: GeminiClient, question: dict, document: str = None) -> dict:
+    result = {"type": "result", **question, "answer": None, "latency": None, "tokens": None, "cost_usd": 0.0, "error": None}
+    started = time.perf_counter()
+    try:
+        # A fresh chat per question: answers depend on the context only, never on other questions.
+        chat_session = ChatSession(EVALUATION_USER_ID, document=document)
+        response, prompt_tokens, response_tokens, total_tokens = await gemini_client.send_message(chat_session, question["question"])
+    except Exception as e:
+        result["latency"] = time.perf_counter() - started
+        result["error"] = str(e) or type(e).__name__
+        return result
+    result["latency"] = time.perf_counter() - started
+    cached_tokens = getattr(response.usage_metadata, "cached_content_token_count", None) or 0
+    result["answer"] = response.text or ""
+    result["tokens"] = {
+        "prompt": prompt_tokens, "cached": cached_tokens, "response": response_tokens, "total": total_tokens,
+    }
+    result["cost_usd"] = cost_usd(prompt_tokens, cached_tokens, response_tokens)
+    return result
+
+class EvaluationSummary:
+    def __init__(self, gemini_client: GeminiClient, document: str, concurrency: int, count: int):
+        self.started = time.perf_counter()
+        self.context = gemini_client.context_name(document)
+        self.document = document
+        self.concurrency = concurrency
+        self.count = count
+        self.latencies = []
+        self.failed = 0
+        self.tokens = {"prompt": 0, "cached": 0, "response": 0, "total": 0}
+        self.cost = 0.0
+
+    def add(self, result: dict):
+        if result["error"]:
+            self.failed += 1
+            return
+        self.latencies.append(result["latency"])
+        for key, value in result["tokens"].items():
+            self.tokens[key] += value
+        self.cost += result["cost_usd"]
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        completed = len(self.latencies) + self.failed
+        return {
+            "type": "summary",
+            "questions": self.count,
+            "completed": completed,
+            "succeeded": len(self.latencies),
+            "failed": self.failed,
+            "elapsed": elapsed,
+            "questions_per_second": completed / elapsed if elapsed > 0 else None,
+            "latency": {
+                "p50": percentile(self.latencies, 50),
+                "p95": percentile(self.latencies, 95),
+                "max": max(self.latencies, default=None),
+            },
+            "tokens": self.tokens,
+            "cost_usd": self.cost,
+            "context": self.context,
+            "document": self.document,
+            "concurrency": self.concurrency,
+        }
+
+async def run_evaluation(questions: list[dict], concurrency: int, document: str = None):
+    """Yield the result of each question as it completes, then the summary.
+
+    `concurrency` workers take questions off a shared queue; closing the
+    generator early (e.g. the HTTP client went away) cancels the calls in flight.
+    """
+    gemini_client = GeminiClient()
+    summary = EvaluationSummary(gemini_client, document, concurrency, len(questions))
+    pending = asyncio.Queue()
+    for question in questions:
+        pending.put_nowait(question)
+    results = asyncio.Queue()
+
+    async def worker():
+        while not pending.empty():
+            question = pending.get_nowait()
+            await results.put(await evaluate_question(gemini_client, question, document))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(questions)))]
+    try:
+        for _ in questions:
+            result = await results.get()
+            summary.add(result)
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    report = summary.as_dict()
+    log_event(
+        "evaluation_finished", questions=report["questions"], failed=report["failed"],
+        seconds=round(report["elapsed"], 3), total_tokens=report["tokens"]["total"], cost_usd=round(report["cost_usd"], 6),
+    )
+    if report["succeeded"]:
+        try:
+            await token_analytics.record_turn(
+                EVALUATION_USER_ID, report["tokens"]["prompt"], report["tokens"]["response"], report["tokens"]["total"],
+                True, model=gemini_client.document_model(document), turns=report["succeeded"],
+            )
+        except Exception as e:
+            log_event("evaluation_rollup_failed", logging.ERROR, error=str(e))
+    yield report
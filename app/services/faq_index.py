@@ -0,0 +1,101 @@
+import logging
+import re
+from dataclasses import dataclass
+from app.config import settings
+from app.services.text_index import TfidfIndex
+from app.services.telemetry import log_event
+
+QUESTION_PREFIXES = ("السؤال:", "الموقف:")
+ANSWER_PREFIX = "الجواب:"
+QUESTION_MARKS = ("؟", "?")
+# The system instruction asks Gemini to sign every answer this way; FAQ answers match it.
+ANSWER_SIGNATURE = "مساعد بنك بيمو الرقمي"
+HEADING = re.compile(r"^#+\s*(.*)")
+
+@dataclass
+class FaqEntry:
+    question: str
+    answer: str
+    section: str
+    kind: str  # "question" for السؤال: pairs, "situation" for الموقف: directions
+
+def parse_faq_entries(text: str) -> list[FaqEntry]:
+    # Walks the document line by line, collecting السؤال:/الموقف: blocks and the الجواب: text after them.
+    # A block ends at the next السؤال:/الموقف: or heading, whether or not it had a الجواب: line.
+    entries = []
+    section = ""
+    question = kind = None
+    answer_lines = None
+    answer_marked = False
+
+    def flush():
+        if not question:
+            return
+        answer = "\n".join(answer_lines or []).strip()
+        if not answer:
+            log_event("faq_block_skipped", logging.WARNING, section=section, question=question, reason="no answer")
+            return
+        if not answer_marked:
+            log_event("faq_answer_marker_missing", logging.WARNING, section=section, question=question)
+        entries.append(FaqEntry(question, answer, section, kind))
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        heading = HEADING.match(line)
+        if heading:
+            flush()
+            question = kind = answer_lines = None
+            section = heading.group(1).strip()
+        elif line.startswith(QUESTION_PREFIXES):
+            flush()
+            kind = "question" if line.startswith(QUESTION_PREFIXES[0]) else "situation"
+            question = line.split(":", 1)[1].strip()
+            answer_lines = None
+            answer_marked = False
+        elif line.startswith(ANSWER_PREFIX):
+            if question:
+                answer_lines = [line[len(ANSWER_PREFIX):].strip()]
+                answer_marked = True
+        elif answer_lines is not None:
+            answer_lines.append(raw_line.rstrip())
+        elif question is not None and line:
+            if question.endswith(QUESTION_MARKS):
+                # The question is complete: text after it without الجواب: is its answer.
+                answer_lines = [raw_line.rstrip()]
+            else:
+                # Questions that wrap onto a second line before الجواب:
+                question = f"{question} {line}"
+    flush()
+    return entries
+
+class FaqIndex(TfidfIndex):
+    """TF-IDF index over character n-grams of the FAQ questions."""
+
+    def __init__(self, entries: list[FaqEntry]):
+        super().__init__([entry.question for entry in entries])
+        self.entries = entries
+
+    @classmethod
+    def from_text(cls, text: str) -> "FaqIndex":
+        return cls(parse_faq_entries(text))
+
+    def search(self, query: str, k: int = 3) -> list[tuple[FaqEntry, float]]:
+        return [(self.entries[i], score) for i, score in self.top_k(query, k)]
+
+    def answer(self, query: str):
+        # Returns (answer, score) for a match above FAQ_MATCH_THRESHOLD, or None.
+        matches = self.search(query, k=1)
+        if not matches:
+            return None
+        entry, score = matches[0]
+        if score < settings.FAQ_MATCH_THRESHOLD:
+            return None
+        return f"{entry.answer}\n\n{ANSWER_SIGNATURE}", score
+
+faq_index: FaqIndex | None = None
+
+def build_faq_index(text: str) -> FaqIndex:
+    global faq_index
+    faq_index = FaqIndex.from_text(text)
+    log_event("faq_index_built", entries=len(faq_index.entries))
+    return faq_index
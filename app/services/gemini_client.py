@@ -1,29 +1,63 @@
-import asyncio
-import json
+import logging
 import pathlib
-import os
 import time
 from datetime import datetime, timezone
 from google import genai
 from google.genai import types
 from app.config import settings
-import PyPDF2  # Ensure PyPDF2 is in your requirements
+from app.services import retrieval
+from app.services import chat_history
+from app.services import ingestion
+from app.services.gemini_scheduler import GeminiScheduler
+from app.services.context_caches import (
+    ContextCacheRegistry, DEFAULT_DOCUMENT, age_seconds, remaining_seconds, is_default_document,
+)
+from app.services import telemetry
+from app.services.telemetry import CONTEXT_CACHE_EVENTS, log_event
 
-CACHE_METADATA_FILE = "cache_metadata.json"
+SYSTEM_INSTRUCTION = (
+    "You are a helpful chatbot for BEMO bank, answering questions "
+    "based on the provided document in the context cache about the bank's products and services."
+    "The data in the cache context is written in Markdown format. Use the Markdown syntax to "
+    "understand the context and provide accurate answers to the user's questions."
+    "Use the headings such as # and ## to understand the sections and to relate the information in the cached data"
+    "You also should use the lists to understand the information in the cached data. It is very important to understand the information in the nested lists and create the most accurate answer"
+    "The content is written in Arabic, and there are many FAQs in the cached data. You should answer the questions in Arabic"
+    "The clients of the bank may ask questions that are not identical to the FAQs in the cached data."
+    "You should be able to analyze the questions and answers in the FAGs"
+    "In the cached data, The FAQs sections are named in Arabic As: "
+    "الأسئلة الشائعة أو الأسئلة الشائعة والمتكررة"
+    "ٍSee this example of a question and answer in the cached data:"
+    "السؤال: ماهي مدة صلاحية كلمة المرور الخاصة بالتطبيق أو الموقع الالكتروني؟  "
+    "الجواب:  "
+    "إن مدة صلاحية كلمة المرور هي 90 يوم وينصح بتغييرها بشكل دوري."
+    "In the cached data, There are directionss on how to answers on the clients questions in some situations"
+    "The direction section starts by this heading and title:"
+    "# توجيهات للإجابة في حالات ومواقف متنوعة عند استفسار الزبون"
+    "Find below an example of a situation and direction in the cached data:"
+    "الموقف: عند تقديم العميل شكوى؟ "
+    "الجواب:    "
+    "العميل العزيز ، سوف يتم مراسلتكم عبر بريد الصفحة الرسمية ليتم معرفة تفاصيل الشكوى ومتابعتها بالشكل الأمثل، وشكراً."
+    "I want  concise, clear and accurate answers to the questions asked by the clients"
+    "Try not to exceed 100 words in your answer"
+    "If the questions of the bank clients are not about the context and not about the bank products and services, Tell him that you cannot answer questions that are not related to BEMO bank"
+    "Let the client feel that he chats with a human and not a machine"
+    "In the end of each message write the following:"
+    "مساعد بنك بيمو الرقمي"
+)
 
-def extract_text_from_pdf(pdf_path: pathlib.Path) -> str:
-    with pdf_path.open("rb") as f:
-        reader = PyPDF2.PdfReader(f)
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-    return text
+def record_token_usage(prompt_tokens: int, response_tokens: int, seconds: float):
+    telemetry.GEMINI_TOKENS.labels("prompt").inc(prompt_tokens)
+    telemetry.GEMINI_TOKENS.labels("response").inc(response_tokens)
+    if seconds > 0 and response_tokens:
+        telemetry.GEMINI_TOKENS_PER_SECOND.observe(response_tokens / seconds)
 
-def extract_text_from_md(md_path: pathlib.Path) -> str:
-    with md_path.open("r", encoding="utf-8") as f:
-        return f.read()
+def get_token_counts(usage_metadata):
+    # Returns (prompt, response, total) token counts from a response's usage metadata.
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+    response_tokens = getattr(usage_metadata, "candidates_token_count", None) or 0
+    total_tokens = getattr(usage_metadata, "total_token_count", None) or prompt_tokens + response_tokens
+    return prompt_tokens, response_tokens, total_tokens
 
 class GeminiClient:
     _instance = None
@@ -43,142 +77,241 @@ class GeminiClient:
         self.md_path = md_path if md_path is not None else settings.MD_PATH
 
         self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        self.cache = None
+        self.document_hash = None  # sha256 of the default document's text last loaded
+        # Every Gemini call goes through the scheduler: a global cap on in-flight
+        # calls, RPM/TPM token buckets, per-user fair queuing and retries.
+        self.scheduler = GeminiScheduler(
+            settings.GEMINI_MAX_CONCURRENT_REQUESTS, settings.GEMINI_RPM, settings.GEMINI_TPM
+        )
+        # Context caches per (document, model, system instruction).
+        self.contexts = ContextCacheRegistry(
+            self, SYSTEM_INSTRUCTION, settings.CONTEXT_CACHE_MAX_ENTRIES, settings.CONTEXT_CACHE_ADMIN_PARALLELISM
+        )
         self.initialized = True
 
-    async def initialize_cache(self):
-        # Step 1. Try to load existing cache metadata from file.
-        cache_metadata = None
-        if os.path.exists(CACHE_METADATA_FILE):
-            try:
-                with open(CACHE_METADATA_FILE, "r") as f:
-                    cache_metadata = json.load(f)
-            except Exception as e:
-                print("Error reading cache metadata file:", e)
-
-        now = datetime.now(timezone.utc)
-        if cache_metadata:
-            try:
-                expire_time = datetime.fromisoformat(cache_metadata["expire_time"])
-                # Check if the cached content is still valid.
-                if expire_time > now:
-                    try:
-                        cache_obj = self.client.caches.get(name=cache_metadata["name"])
-                        print(f"Using existing cache: {cache_obj.name}")
-                        self.cache = cache_obj
-                        return self.cache
-                    except Exception as e:
-                        print("Error retrieving cache by name:", e)
-                else:
-                    print("Cached content expired.")
-            except Exception as e:
-                print("Error processing cache metadata:", e)
-
-        # Step 2. No valid cache found; create a new cache.
-        def load_file_text():
-            if self.file_ext.lower() == "pdf":
-                file_path = pathlib.Path(settings.PDF_PATH)
-                if not file_path.exists():
-                    raise FileNotFoundError(f"PDF file not found: {file_path}")
-                return extract_text_from_pdf(file_path)
-            elif self.file_ext.lower() == "md":
-                file_path = pathlib.Path(self.md_path)
-                if not file_path.exists():
-                    raise FileNotFoundError(f"Markdown file not found: {file_path}")
-                return extract_text_from_md(file_path)
-            else:
-                raise ValueError("Unsupported file extension for cached content")
-
-        file_text = await asyncio.to_thread(load_file_text)
-
-        def create_cache():
-            return self.client.caches.create(
-                model=settings.GEMINI_MODEL_NAME,
-                config=types.CreateCachedContentConfig(
-                    display_name='BEMO Bank Information',
-                    system_instruction=(
-                        "You are a helpful chatbot for BEMO bank, answering questions "
-                        "based on the provided document in the context cache about the bank's products and services."
-                        "The data in the cache context is written in Markdown format. Use the Markdown syntax to "
-                        "understand the context and provide accurate answers to the user's questions."
-                        "Use the headings such as # and ## to understand the sections and to relate the information in the cached data"
-                        "You also should use the lists to understand the information in the cached data. It is very important to understand the information in the nested lists and create the most accurate answer"
-                        "The content is written in Arabic, and there are many FAQs in the cached data. You should answer the questions in Arabic"
-                        "The clients of the bank may ask questions that are not identical to the FAQs in the cached data."
-                        "You should be able to analyze the questions and answers in the FAGs"
-                        "In the cached data, The FAQs sections are named in Arabic As: "
-                        "الأسئلة الشائعة أو الأسئلة الشائعة والمتكررة"
-                        "ٍSee this example of a question and answer in the cached data:"
-                        "السؤال: ماهي مدة صلاحية كلمة المرور الخاصة بالتطبيق أو الموقع الالكتروني؟  "
-                        "الجواب:  "
-                        "إن مدة صلاحية كلمة المرور هي 90 يوم وينصح بتغييرها بشكل دوري."
-                        "In the cached data, There are directionss on how to answers on the clients questions in some situations"
-                        "The direction section starts by this heading and title:"
-                        "# توجيهات للإجابة في حالات ومواقف متنوعة عند استفسار الزبون"
-                        "Find below an example of a situation and direction in the cached data:"
-                        "الموقف: عند تقديم العميل شكوى؟ "
-                        "الجواب:    "
-                        "العميل العزيز ، سوف يتم مراسلتكم عبر بريد الصفحة الرسمية ليتم معرفة تفاصيل الشكوى ومتابعتها بالشكل الأمثل، وشكراً."
-                        "I want  concise, clear and accurate answers to the questions asked by the clients"
-                        "Try not to exceed 100 words in your answer"
-                        "If the questions of the bank clients are not about the context and not about the bank products and services, Tell him that you cannot answer questions that are not related to BEMO bank"
-                        "Let the client feel that he chats with a human and not a machine"
-                        "In the end of each message write the following:"
-                        "مساعد بنك بيمو الرقمي"
-                        
-                        
-                        
-                    ),
-                    contents=[file_text],
-                    ttl=settings.CACHE_TTL,
-                )
+    @property
+    def cache(self):
+        # The default document's context cache.
+        return self.contexts.get(DEFAULT_DOCUMENT)
+
+    @property
+    def cache_lifecycle(self) -> dict:
+        return self.contexts.lifecycle
+
+    def slot(self, user_id: str = None):
+        # A scheduler slot for a call made outside `call` (e.g. listing caches).
+        return self.scheduler.slot(user_id)
+
+    async def call(self, request, user_id: str = None):
+        # Runs request() through the scheduler, with retries on transient errors.
+        return await self.scheduler.call(request, user_id)
+
+    def document_path(self) -> pathlib.Path:
+        # The bank document that backs the context cache.
+        if self.file_ext.lower() == "pdf":
+            file_path = pathlib.Path(settings.PDF_PATH)
+            if not file_path.exists():
+                raise FileNotFoundError(f"PDF file not found: {file_path}")
+            return file_path
+        elif self.file_ext.lower() == "md":
+            file_path = pathlib.Path(self.md_path)
+            if not file_path.exists():
+                raise FileNotFoundError(f"Markdown file not found: {file_path}")
+            return file_path
+        else:
+            raise ValueError("Unsupported file extension for cached content")
+
+    def load_document_text(self) -> str:
+        # Reads the bank document, reusing previously extracted text while its hash is unchanged.
+        text, self.document_hash = ingestion.load_document(self.document_path(), self.file_ext.lower())
+        return text
+
+    async def initialize_cache(self, document_text=None):
+        # The default document's cache, reused from the saved metadata while it is live
+        # and built from the same document version, model and system instruction.
+        # document_text: an awaitable of the document text, e.g. a load already running
+        # at startup; without one the document is read here if a cache has to be created.
+        cache = await self.contexts.ensure(DEFAULT_DOCUMENT, document_text)
+        self.document_hash = self.contexts.current_key(DEFAULT_DOCUMENT).document_hash
+        return cache
+
+    async def create_cache(self, file_text: str, model: str = None):
+        return await self.call(lambda: self.client.aio.caches.create(
+            model=model or settings.GEMINI_MODEL_NAME,
+            config=types.CreateCachedContentConfig(
+                display_name='BEMO Bank Information',
+                system_instruction=SYSTEM_INSTRUCTION,
+                contents=[file_text],
+                ttl=settings.CACHE_TTL,
             )
-        self.cache = await asyncio.to_thread(create_cache)
-        print(f"Created new cache: {self.cache.name}")
-
-        # Step 3. Save cache metadata to file.
-        metadata = {
-            "name": self.cache.name,
-            "model": self.cache.model,
-            "display_name": self.cache.display_name,
-            "create_time": str(self.cache.create_time),
-            "update_time": str(self.cache.update_time),
-            "expire_time": str(self.cache.expire_time)
-        }
-        try:
-            with open(CACHE_METADATA_FILE, "w") as f:
-                json.dump(metadata, f, indent=4)
-            print("Cache metadata saved to", CACHE_METADATA_FILE)
-        except Exception as e:
-            print("Error writing cache metadata file:", e)
+        ))
+
+    def save_cache_metadata(self):
+        self.contexts.save_metadata()
+
+    def cache_age_seconds(self):
+        return age_seconds(self.cache)
+
+    def cache_remaining_seconds(self):
+        return remaining_seconds(self.cache)
+
+    async def refresh_cache(self):
+        # Extends (or replaces) every held context cache close to its expiry; see ContextCacheRegistry.refresh.
+        return await self.contexts.refresh_all()
+
+    def use_retrieval(self, document: str = None) -> bool:
+        # Retrieval mode is used when configured, or as a fallback while the context cache is missing or expired.
+        # The section index covers the default document only.
+        if retrieval.section_index is None or not is_default_document(document):
+            return False
+        if settings.CONTEXT_MODE == "retrieval" or not self.cache:
+            return True
+        return bool(self.cache.expire_time and self.cache.expire_time <= datetime.now(timezone.utc))
 
-        return self.cache
+    def document_model(self, document: str = None) -> str:
+        # The model answering turns on the document.
+        return settings.GEMINI_MODEL_NAME if is_default_document(document) else self.contexts.document(document).model
 
-    def create_chat(self):
+    def context_name(self, document: str = None):
+        # Identifies the context answers are generated from; answers are cached per context.
+        if self.use_retrieval(document):
+            return "retrieval"
+        cache = self.contexts.get(document)
+        return cache.name if cache else None
+
+    def retrieval_config(self, message):
+        # Per-turn config carrying only the sections relevant to the message, so they stay out of the chat history.
+        context, context_chars = retrieval.section_index.context_for(message, settings.RETRIEVAL_TOP_K)
+        config = types.GenerateContentConfig(
+            system_instruction=f"{SYSTEM_INSTRUCTION}\n\nThe relevant sections of the cached data:\n\n{context}"
+        )
+        return config, context_chars
+
+    async def turn_config(self, message, document: str = None):
+        # Config for one turn. In cache mode the document's current cache is bound
+        # on every turn, so chats created before a cache swap pick up the new handle.
+        # Other documents' caches are created on first use.
+        if self.use_retrieval(document):
+            if settings.CONTEXT_MODE == "cache":
+                CONTEXT_CACHE_EVENTS.labels("retrieval_fallback").inc()
+            return self.retrieval_config(message)
+        cache = self.cache if is_default_document(document) else await self.contexts.ensure(document)
+        if cache:
+            CONTEXT_CACHE_EVENTS.labels("hit").inc()
+            return types.GenerateContentConfig(cached_content=cache.name), None
+        return None, None
+
+    async def count_document_tokens(self, document_text: str):
+        # Token size of the full document, used to report retrieval-mode savings.
+        result = await self.call(lambda: self.client.aio.models.count_tokens(
+            model=settings.GEMINI_MODEL_NAME, contents=[document_text]
+        ))
+        retrieval.retrieval_stats.document_tokens = result.total_tokens
+        return result.total_tokens
+
+    def create_chat(self, history=None, document: str = None):
+        if not is_default_document(document):
+            # Bound to the document's cache on every turn (see turn_config), which may not exist yet.
+            return self.client.aio.chats.create(model=self.contexts.document(document).model, history=history)
+        if self.use_retrieval():
+            return self.client.aio.chats.create(
+                model=settings.GEMINI_MODEL_NAME,
+                config=types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION),
+                history=history,
+            )
         if not self.cache:
             raise ValueError("No cached content found. Ensure cache is initialized.")
         try:
-            return self.client.chats.create(
+            return self.client.aio.chats.create(
                 model=settings.GEMINI_MODEL_NAME,
                 config=types.GenerateContentConfig(
                     cached_content=self.cache.name
-                )
+                ),
+                history=history,
             )
         except Exception as e:
-            print(f"Failed to create chat: {e}")
+            log_event("chat_create_failed", logging.ERROR, error=str(e))
             return None
 
+    async def summarize_turns(self, turns, user_id: str = None):
+        # Folds older turns into a short summary; returns (summary, total tokens spent).
+        response = await self.call(lambda: self.client.aio.models.generate_content(
+            model=settings.GEMINI_MODEL_NAME,
+            contents=chat_history.SUMMARY_PROMPT + chat_history.transcript(turns),
+        ), user_id)
+        return response.text or "", get_token_counts(response.usage_metadata)[2]
+
+    async def apply_history_policy(self, chat_session) -> int:
+        """Trim the session's chat history according to HISTORY_POLICY before a turn.
+
+        "full" keeps everything, "window" keeps the last HISTORY_MAX_TURNS turns,
+        "token_budget" keeps the most recent turns within HISTORY_TOKEN_BUDGET, and
+        "summary" folds older turns into a summary once HISTORY_MAX_TURNS is exceeded,
+        keeping the most recent half verbatim. Returns the tokens spent on summarizing.
+        """
+        policy = settings.HISTORY_POLICY
+        if policy == "full" or not chat_session.chat:
+            return 0
+        turns = chat_history.group_turns(chat_session.chat.get_history(curated=True))
+        summary_tokens = 0
+        if policy == "window":
+            kept = chat_history.keep_last_turns(turns, settings.HISTORY_MAX_TURNS)
+        elif policy == "token_budget":
+            kept = chat_history.keep_within_budget(turns, settings.HISTORY_TOKEN_BUDGET)
+        elif policy == "summary":
+            if len(turns) <= settings.HISTORY_MAX_TURNS:
+                return 0
+            keep_count = settings.HISTORY_MAX_TURNS // 2
+            older, recent = turns[:len(turns) - keep_count], turns[len(turns) - keep_count:]
+            summary, summary_tokens = await self.summarize_turns(older, chat_session.user_id)
+            kept = [chat_history.summary_turn(summary)] + recent
+        else:
+            raise ValueError(f"Unsupported history policy: {policy}")
+
+        if len(kept) != len(turns) or summary_tokens:
+            chat_session.chat = self.create_chat(history=chat_history.flatten_turns(kept), document=chat_session.document)
+        return summary_tokens
+
     async def send_message(self, chat_session, message):
         if not chat_session.chat:
             raise ValueError("Chat session is not initialized properly.")
 
-        def _send():
-            return chat_session.chat.send_message(message)
+        config, context_chars = await self.turn_config(message, chat_session.document)
+        chat = chat_session.chat
+        started = time.perf_counter()
+        response = await self.call(lambda: chat.send_message(message, config=config), chat_session.user_id)
+        prompt_tokens, response_tokens, total_tokens = get_token_counts(response.usage_metadata)
+        record_token_usage(prompt_tokens, response_tokens, time.perf_counter() - started)
+        if context_chars is not None:
+            retrieval.retrieval_stats.record(prompt_tokens, context_chars)
+        return response, prompt_tokens, response_tokens, total_tokens
+
+    async def send_message_stream(self, chat_session, message):
+        """Yield the model's response chunks as the SDK streams them.
+
+        The SDK records the turn in the chat history only once the stream is
+        exhausted, so callers must consume the generator to the end.
+        """
+        if not chat_session.chat:
+            raise ValueError("Chat session is not initialized properly.")
 
-        response = await asyncio.to_thread(_send)
-        prompt_tokens = response.usage_metadata.prompt_token_count if hasattr(response.usage_metadata, "prompt_token_count") else 0
-        response_tokens = response.usage_metadata.candidates_token_count if hasattr(response.usage_metadata, "candidates_token_count") else 0
-        total_tokens = response.usage_metadata.total_token_count if hasattr(response.usage_metadata, "total_token_count") else prompt_tokens + response_tokens
+        config, context_chars = await self.turn_config(message, chat_session.document)
+        usage_metadata = None
+        chat = chat_session.chat
+        started = time.perf_counter()
+        stream = self.scheduler.stream(lambda: chat.send_message_stream(message, config=config), chat_session.user_id)
+        async for chunk in stream:
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            yield chunk
+        prompt_tokens, response_tokens, _ = get_token_counts(usage_metadata)
+        record_token_usage(prompt_tokens, response_tokens, time.perf_counter() - started)
+        if context_chars is not None:
+            retrieval.retrieval_stats.record(prompt_tokens, context_chars)
 
-        print(f"Token Usage - Prompt: {prompt_tokens}, Response: {response_tokens}, Total: {total_tokens}")
-        return response, prompt_tokens, response_tokens, total_tokens
\ No newline at end of file
+    def record_turn(self, chat_session, message, answer):
+        # Appends a turn answered outside Gemini to the chat history so follow-ups keep their context.
+        chat_session.chat.record_history(
+            user_input=types.Content(role="user", parts=[types.Part(text=message)]),
+            model_output=[types.Content(role="model", parts=[types.Part(text=answer)])],
+            is_valid=True,
+        )
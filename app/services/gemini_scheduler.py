@@ -0,0 +1,274 @@
+"""Outbound scheduling of Gemini calls.
+
+Every Gemini call takes a slot from the GeminiScheduler first. A slot is
+granted when fewer than GEMINI_MAX_CONCURRENT_REQUESTS calls are in flight
+and the request and token buckets (GEMINI_RPM, GEMINI_TPM) allow another
+call. Waiting callers are queued per user and served round-robin, so one busy
+user cannot take every slot. Calls failing with a retryable error (429, 5xx,
+network errors) are retried with jittered exponential backoff until
+GEMINI_MAX_RETRIES or the call's deadline is reached.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import httpx
+from google.genai import errors
+from app.config import settings
+from app.services.telemetry import Counter, Gauge, Histogram, STAGE_SECONDS, log_event
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+QUEUE_DEPTH = Histogram(
+    "bemo_gemini_queue_depth", "Callers already queued when a Gemini call had to wait.", buckets=QUEUE_DEPTH_BUCKETS
+)
+SCHEDULER_EVENTS = Counter(
+    "bemo_gemini_scheduler_events_total",
+    "Gemini scheduler events: granted, rejected, rate_limited, retries, retries_exhausted, deadline_exceeded.",
+    ["event"],
+)
+IN_FLIGHT = Gauge("bemo_gemini_in_flight", "Gemini calls in flight.")
+QUEUED = Gauge("bemo_gemini_queued", "Gemini calls waiting for a slot.")
+SCHEDULER_EVENT_NAMES = ("granted", "rejected", "rate_limited", "retries", "retries_exhausted", "deadline_exceeded")
+
+class GeminiOverloadedError(Exception):
+    """Raised when a Gemini call cannot get an in-flight slot within the queue timeout or its deadline."""
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError))
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # Seconds until `amount` units (capped at the capacity) are available.
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        # May go negative: the debt is paid back before the next call is let through.
+        self._refill()
+        self.tokens -= amount
+
+class Ticket:
+    __slots__ = ("charged_tokens", "used_tokens")
+
+    def __init__(self, charged_tokens: float):
+        self.charged_tokens = charged_tokens  # Estimate taken from the token bucket when the slot was granted
+        self.used_tokens = None  # Actual total tokens, set by the caller once known
+
+class GeminiScheduler:
+    def __init__(self, max_in_flight: int, rpm: int = 0, tpm: int = 0):
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        # Running average of tokens per call, charged to the token bucket up front
+        # and corrected with the actual usage when the call finishes.
+        self.estimated_tokens = 1000.0
+        # Waiters per user, in round-robin order.
+        self._queues: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self._queued = 0
+        self._timer = None
+        self.in_flight = 0
+        self.wait_seconds = STAGE_SECONDS.labels("gemini_queue_wait")
+        self.queue_depth = QUEUE_DEPTH.labels()
+        self._stats = {name: SCHEDULER_EVENTS.labels(name) for name in SCHEDULER_EVENT_NAMES}
+        IN_FLIGHT.set_function(lambda: self.in_flight)
+        QUEUED.set_function(lambda: self._queued)
+
+    def _rate_wait(self) -> float:
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(self.estimated_tokens))
+        return wait
+
+    def _grant(self) -> Ticket:
+        self.in_flight += 1
+        self._stats["granted"].inc()
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(self.estimated_tokens)
+        return Ticket(self.estimated_tokens)
+
+    def _dispatch(self):
+        # Grants free slots to queued callers, one user at a time in turn.
+        while self._queues and self.in_flight < self.max_in_flight:
+            wait = self._rate_wait()
+            if wait > 0:
+                if self._timer is None:
+                    self._stats["rate_limited"].inc()
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+            user_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not future.done():
+                future.set_result(self._grant())
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _remove(self, user_id: str, future: asyncio.Future):
+        queue = self._queues.get(user_id)
+        if queue and future in queue:
+            queue.remove(future)
+            self._queued -= 1
+            if not queue:
+                del self._queues[user_id]
+
+    async def acquire(self, user_id: str = None, timeout: float = None) -> Ticket:
+        user_id = user_id or ""
+        timeout = settings.GEMINI_QUEUE_TIMEOUT if timeout is None else timeout
+        if not self._queues and self.in_flight < self.max_in_flight and self._rate_wait() == 0:
+            self.wait_seconds.observe(0.0)
+            return self._grant()
+
+        started = time.monotonic()
+        self.queue_depth.observe(self._queued)
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(future)
+        self._queued += 1
+        self._dispatch()
+        try:
+            ticket = await asyncio.wait_for(future, timeout=max(timeout, 0))
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Granted just as the wait ended: hand the slot back.
+                self.release(future.result())
+            else:
+                self._remove(user_id, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats["rejected"].inc()
+                raise GeminiOverloadedError(f"Gemini is busy: no slot freed up within {timeout:.1f}s.")
+            raise
+        self.wait_seconds.observe(time.monotonic() - started)
+        return ticket
+
+    def release(self, ticket: Ticket):
+        self.in_flight -= 1
+        if ticket.used_tokens:
+            if self.tokens:
+                self.tokens.take(ticket.used_tokens - ticket.charged_tokens)
+            self.estimated_tokens = 0.9 * self.estimated_tokens + 0.1 * ticket.used_tokens
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str = None, timeout: float = None):
+        ticket = await self.acquire(user_id, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def _backoff(self, attempt: int, error: Exception, deadline: float) -> bool:
+        # Sleeps before retrying `error`; False when the error is final.
+        if not is_retryable(error):
+            return False
+        if attempt >= settings.GEMINI_MAX_RETRIES:
+            self._stats["retries_exhausted"].inc()
+            return False
+        delay = random.uniform(0, min(settings.GEMINI_RETRY_MAX_DELAY, settings.GEMINI_RETRY_BASE_DELAY * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            self._stats["retries_exhausted"].inc()
+            return False
+        self._stats["retries"].inc()
+        log_event("gemini_retry", logging.WARNING, attempt=attempt + 1, delay=round(delay, 3), error=str(error))
+        await asyncio.sleep(delay)
+        return True
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._stats["deadline_exceeded"].inc()
+            raise GeminiOverloadedError("Gemini call deadline exceeded.")
+        return remaining
+
+    async def call(self, request, user_id: str = None, deadline: float = None):
+        """Await request() under a slot, retrying retryable errors until the deadline.
+
+        request is a zero-argument function returning a new awaitable per attempt.
+        """
+        deadline = deadline or time.monotonic() + settings.GEMINI_REQUEST_DEADLINE
+        attempt = 0
+        while True:
+            remaining = self._remaining(deadline)
+            try:
+                async with self.slot(user_id, min(settings.GEMINI_QUEUE_TIMEOUT, remaining)) as ticket:
+                    try:
+                        with STAGE_SECONDS.labels("gemini_call").time():
+                            response = await asyncio.wait_for(request(), timeout=self._remaining(deadline))
+                    except asyncio.TimeoutError:
+                        self._stats["deadline_exceeded"].inc()
+                        raise GeminiOverloadedError("Gemini call deadline exceeded.")
+                    ticket.used_tokens = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
+                    return response
+            except Exception as e:
+                if not await self._backoff(attempt, e, deadline):
+                    raise
+            attempt += 1
+
+    async def stream(self, request, user_id: str = None, deadline: float = None):
+        """Yield the chunks of the stream returned by `await request()` under a slot.
+
+        Only failures before the first chunk are retried; the deadline bounds
+        queueing and retries, not the length of the stream.
+        """
+        deadline = deadline or time.monotonic() + settings.GEMINI_REQUEST_DEADLINE
+        attempt = 0
+        while True:
+            remaining = self._remaining(deadline)
+            started = False
+            try:
+                async with self.slot(user_id, min(settings.GEMINI_QUEUE_TIMEOUT, remaining)) as ticket:
+                    requested = time.perf_counter()
+                    async for chunk in await request():
+                        if not started:
+                            STAGE_SECONDS.labels("gemini_first_chunk").observe(time.perf_counter() - requested)
+                        started = True
+                        usage = getattr(chunk, "usage_metadata", None)
+                        ticket.used_tokens = getattr(usage, "total_token_count", None) or ticket.used_tokens
+                        yield chunk
+                    return
+            except Exception as e:
+                if started or not await self._backoff(attempt, e, deadline):
+                    raise
+            attempt += 1
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self._queued,
+            "queued_users": len(self._queues),
+            "estimated_tokens_per_call": self.estimated_tokens,
+            "rpm_limit": self.requests.capacity if self.requests else None,
+            "tpm_limit": self.tokens.capacity if self.tokens else None,
+            **{name: int(counter.value) for name, counter in self._stats.items()},
+            "wait_seconds": self.wait_seconds.snapshot(),
+            "queue_depth": self.queue_depth.snapshot(),
+        }
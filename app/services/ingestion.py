@@ -0,0 +1,78 @@
+"""Content-addressed ingestion of the bank document.
+
+The source file is hashed, and the text extracted from it is stored on disk
+under EXTRACTED_TEXT_DIR as <sha256>.txt. An unchanged document is read back
+from there instead of being parsed again; a changed one gets a new hash, which
+is also recorded in the context cache metadata so a new cache is created.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from app.config import settings
+from app.services.telemetry import log_event
+
+# Pages extracted per process pool task.
+PAGES_PER_TASK = 8
+
+def file_hash(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def extract_pdf_pages(pdf_path: str, start: int, stop: int) -> list[str]:
+    # Runs in a worker process: each worker opens its own reader.
+    import PyPDF2  # Imported on first use: the markdown document never needs it
+    with open(pdf_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def extract_text_from_pdf(pdf_path: pathlib.Path, workers: int = None) -> str:
+    import PyPDF2
+    workers = workers or settings.INGEST_WORKERS
+    with pdf_path.open("rb") as f:
+        page_count = len(PyPDF2.PdfReader(f).pages)
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    # A process pool only pays off with several cores and several page ranges.
+    if workers < 2 or (os.cpu_count() or 1) < 2 or len(ranges) < 2:
+        pages = extract_pdf_pages(str(pdf_path), 0, page_count)
+    else:
+        # Spawned, not forked: extraction runs from a worker thread of the server.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as pool:
+            chunks = pool.map(extract_pdf_pages, *zip(*[(str(pdf_path), start, stop) for start, stop in ranges]))
+            pages = [page for chunk in chunks for page in chunk]
+    return "".join(page + "\n" for page in pages if page)
+
+def extract_text_from_md(md_path: pathlib.Path) -> str:
+    with md_path.open("r", encoding="utf-8") as f:
+        return f.read()
+
+def extracted_text_path(document_hash: str) -> pathlib.Path:
+    return pathlib.Path(settings.EXTRACTED_TEXT_DIR) / f"{document_hash}.txt"
+
+def load_document(path: pathlib.Path, file_ext: str) -> tuple[str, str]:
+    """Return (text, sha256 of the source file), extracting a PDF only on a hash miss."""
+    document_hash = file_hash(path)
+    if file_ext == "md":
+        # Markdown is its own text; only PDFs are worth keeping extracted.
+        return extract_text_from_md(path), document_hash
+    text_path = extracted_text_path(document_hash)
+    if text_path.exists():
+        return text_path.read_text(encoding="utf-8"), document_hash
+
+    text = extract_text_from_pdf(path)
+
+    # Write to a temporary file and rename it, so a partial file is never read back.
+    try:
+        text_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = text_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, text_path)
+    except Exception as e:
+        log_event("extracted_text_save_failed", logging.ERROR, path=str(text_path), error=str(e))
+    return text, document_hash
@@ -0,0 +1,162 @@
+"""Conversation messages stored in fixed-size buckets outside the conversation document.
+
+Each bucket document holds up to MESSAGE_BUCKET_SIZE messages of one
+conversation:
+
+    {"conversation_id": ObjectId, "count": int, "first_id": ObjectId,
+     "last_id": ObjectId, "messages": [{"_id": ObjectId, "role": ..., ...}]}
+
+Messages are identified and ordered by their ObjectId `_id`, which is also the
+cursor for paginating history. The conversation document itself only keeps
+metadata and a `message_count`.
+"""
+import heapq
+import struct
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING
+from app.config import settings
+from app.services.write_buffer import WriteBehindBuffer
+from app.services.telemetry import STAGE_SECONDS, log_event
+
+BUCKETS_COLLECTION = "message_buckets"
+
+bucket_writes = WriteBehindBuffer(
+    BUCKETS_COLLECTION, settings.MONGO_WRITE_BEHIND_MAX_BATCH, settings.MONGO_WRITE_BEHIND_INTERVAL
+)
+
+async def ensure_message_indexes(db):
+    await db[BUCKETS_COLLECTION].create_index([("conversation_id", ASCENDING), ("first_id", ASCENDING)])
+    # History pages read the buckets newest last message first.
+    await db[BUCKETS_COLLECTION].create_index([("conversation_id", ASCENDING), ("last_id", ASCENDING)])
+
+def append_update(conversation_id: ObjectId, messages: list[dict]):
+    # Filter and update that push `messages` into a bucket with room for all of them,
+    # upserting a new bucket when every existing one is full.
+    ids = [message["_id"] for message in messages]
+    bucket_filter = {
+        "conversation_id": conversation_id,
+        "count": {"$lte": settings.MESSAGE_BUCKET_SIZE - len(messages)},
+    }
+    update = {
+        "$push": {"messages": {"$each": messages}},
+        "$inc": {"count": len(messages)},
+        "$min": {"first_id": min(ids)},
+        "$max": {"last_id": max(ids)},
+    }
+    return bucket_filter, update
+
+async def append_messages(db, conversation_id: ObjectId, messages: list[dict]):
+    # The messages land in a single bucket, so they are written atomically.
+    bucket_filter, update = append_update(conversation_id, messages)
+    if settings.MONGO_WRITE_BEHIND:
+        await bucket_writes.add(bucket_filter, update, upsert=True)
+    else:
+        with STAGE_SECONDS.labels("mongo_update_one_bucket").time():
+            await db[BUCKETS_COLLECTION].update_one(bucket_filter, update, upsert=True)
+
+async def collect_messages(cursor, selected: dict, newest: list, before: ObjectId = None, limit: int = None, decode=None):
+    # Adds the messages of the buckets of `cursor` (sorted by last_id, newest first)
+    # to `selected`, by id. `newest` is a min-heap of the `limit` newest selected ids.
+    async for bucket in cursor:
+        # Buckets filled concurrently can overlap, but every later bucket ends before
+        # this one: once it ends before the `limit` newest messages selected so far,
+        # nothing newer is left.
+        if limit and len(newest) >= limit and bucket["last_id"] < newest[0]:
+            break
+        for message in decode(bucket["messages"]) if decode else bucket["messages"]:
+            if (before is not None and message["_id"] >= before) or message["_id"] in selected:
+                continue
+            selected[message["_id"]] = message
+            if limit:
+                heapq.heappush(newest, message["_id"])
+                if len(newest) > limit:
+                    heapq.heappop(newest)
+
+async def get_messages(db, conversation_id: ObjectId, before: ObjectId = None, limit: int = None, archived: bool = None) -> list[dict]:
+    """Return the conversation's messages in chronological order.
+
+    With `before`, only messages older than that message id are returned; with
+    `limit`, only the newest `limit` of them. The compressed archive chunks are
+    read too when the conversation is `archived`, or, when that is not known
+    (None), whenever the buckets hold fewer than `limit` matching messages.
+    """
+    from app.services import archive
+    query = {"conversation_id": conversation_id}
+    if before is not None:
+        query["first_id"] = {"$lt": before}
+    selected, newest = {}, []
+    cursor = db[BUCKETS_COLLECTION].find(query, {"messages": 1, "last_id": 1}).sort("last_id", -1)
+    await collect_messages(cursor, selected, newest, before, limit)
+    if archived or (archived is None and (not limit or len(selected) < limit)):
+        cursor = db[archive.ARCHIVE_COLLECTION].find(query, {"messages": 1, "last_id": 1}).sort("last_id", -1)
+        await collect_messages(cursor, selected, newest, before, limit, decode=archive.decompress_messages)
+    messages = sorted(selected.values(), key=lambda message: message["_id"])
+    return messages[-limit:] if limit else messages
+
+async def iter_message_batches(db, conversation_id: ObjectId, archived: bool = False):
+    """Yield the conversation's messages one bucket at a time, oldest bucket first,
+    reading the buckets in cursor batches of EXPORT_BATCH_SIZE. The archive
+    chunks of an `archived` conversation come first.
+
+    Messages are ordered within a bucket; buckets filled concurrently may
+    overlap, so across buckets the order is only approximate.
+    """
+    from app.services import archive
+    conversation_filter = {"conversation_id": conversation_id}
+    if archived:
+        # A chunk whose bucket still exists was not archived (see archive.archive_conversation).
+        hot_buckets = set(await db[BUCKETS_COLLECTION].distinct("_id", conversation_filter))
+        cursor = db[archive.ARCHIVE_COLLECTION].find(conversation_filter, {"messages": 1}).sort("first_id", 1)
+        async for chunk in cursor.batch_size(settings.EXPORT_BATCH_SIZE):
+            if chunk["_id"] not in hot_buckets:
+                yield sorted(archive.decompress_messages(chunk["messages"]), key=lambda message: message["_id"])
+    cursor = db[BUCKETS_COLLECTION].find(conversation_filter, {"messages": 1}).sort("first_id", 1)
+    async for bucket in cursor.batch_size(settings.EXPORT_BATCH_SIZE):
+        yield sorted(bucket["messages"], key=lambda message: message["_id"])
+
+def legacy_message_id(timestamp: datetime, index: int) -> ObjectId:
+    # Deterministic, time-ordered ids for messages migrated from the inline array:
+    # they sort before any real ObjectId generated later in the same second.
+    return ObjectId(ObjectId.from_datetime(timestamp).binary[:4] + b"\x00" * 5 + struct.pack(">I", index)[1:])
+
+async def migrate_inline_messages(db, conversation: dict) -> int:
+    """Move a conversation's legacy inline `messages` array into buckets.
+
+    Idempotent: buckets are upserted by their legacy index, and the array is
+    only unset (and counted) by the first migration to reach the conversation.
+    """
+    inline_messages = conversation.get("messages") or []
+    size = settings.MESSAGE_BUCKET_SIZE
+    for index, message in enumerate(inline_messages):
+        message.setdefault("_id", legacy_message_id(message["timestamp"], index))
+    for legacy_index, start in enumerate(range(0, len(inline_messages), size)):
+        chunk = inline_messages[start:start + size]
+        await db[BUCKETS_COLLECTION].update_one(
+            {"conversation_id": conversation["_id"], "legacy_index": legacy_index},
+            {"$setOnInsert": {
+                "count": size,  # Legacy buckets are never appended to.
+                "first_id": chunk[0]["_id"],
+                "last_id": chunk[-1]["_id"],
+                "messages": chunk,
+            }},
+            upsert=True,
+        )
+    await db.conversations.update_one(
+        {"_id": conversation["_id"], "messages": {"$exists": True}},
+        {"$unset": {"messages": ""}, "$inc": {"message_count": len(inline_messages)}},
+    )
+    return len(inline_messages)
+
+async def migrate_all_inline_messages(db):
+    # Background sweep over conversations still storing their messages inline.
+    migrated = 0
+    async for conversation in db.conversations.find({"messages": {"$exists": True}}):
+        await migrate_inline_messages(db, conversation)
+        migrated += 1
+    if migrated:
+        log_event("inline_messages_migrated", conversations=migrated)
+    return migrated
+
+def serialize_message(message: dict) -> dict:
+    return {**message, "_id": str(message["_id"])}
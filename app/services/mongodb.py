@@ -1,4 +1,5 @@
 import motor.motor_asyncio
+from pymongo import ASCENDING, DESCENDING
 from app.config import settings
 
 class MongoDBClient:
@@ -14,3 +15,22 @@ class MongoDBClient:
     def get_database(cls):
         client = cls.get_client()
         return client[settings.MONGODB_DB]
+
+    @classmethod
+    async def ensure_indexes(cls):
+        # Indexes backing the hot lookups; create_index is a no-op when they already exist.
+        db = cls.get_database()
+        # Per-user conversation listing, newest first.
+        await db.conversations.create_index([("user_id", ASCENDING), ("last_message_time", DESCENDING)])
+        # History and token-stats look conversations up by _id and owner.
+        await db.conversations.create_index([("_id", ASCENDING), ("user_id", ASCENDING)])
+        from app.services.message_store import ensure_message_indexes
+        await ensure_message_indexes(db)
+        from app.services.session_store import session_store
+        await session_store.ensure_indexes()
+        from app.services.admission import admission
+        await admission.ensure_indexes()
+        from app.services import token_analytics
+        await token_analytics.ensure_indexes()
+        from app.services import archive
+        await archive.ensure_indexes()
@@ -0,0 +1,92 @@
+"""Startup warm-up state, for the liveness and readiness endpoints.
+
+The server accepts connections as soon as the app is imported; the warm-up
+steps then run in the background, concurrently: "mongo" (connect and create
+indexes), "document" (read the bank document and build its FAQ and section
+indexes) and, in cache mode, "context_cache" (reuse or create the Gemini
+context cache). The worker is ready once MongoDB and the document are, and
+in cache mode the context cache too. A context cache that failed to
+initialize does not hold readiness back: turns fall back to retrieval until
+a retry succeeds.
+"""
+import logging
+import time
+from app.config import settings
+from app.services.telemetry import Gauge, log_event
+
+READY = Gauge("bemo_ready", "1 once the startup warm-up has finished and the worker accepts traffic.")
+
+class Step:
+    __slots__ = ("state", "seconds", "error", "attempts")
+
+    def __init__(self):
+        self.state = "pending"  # pending, running, ready or failed
+        self.seconds = None  # Duration of the last attempt
+        self.error = None
+        self.attempts = 0
+
+class Readiness:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.ready_after = None  # Seconds from app import to ready
+        self.steps: dict[str, Step] = {}
+        READY.set_function(lambda: int(self.ready))
+
+    def required_steps(self) -> list[str]:
+        return ["mongo", "document"] + (["context_cache"] if settings.CONTEXT_MODE == "cache" else [])
+
+    async def run_step(self, name: str, awaitable) -> bool:
+        # Awaits one warm-up step, recording its state and duration; False if it failed.
+        step = self.steps.setdefault(name, Step())
+        step.state = "running"
+        step.attempts += 1
+        started = time.perf_counter()
+        try:
+            await awaitable
+        except Exception as e:
+            step.state, step.error = "failed", str(e)
+            log_event("warmup_step_failed", logging.ERROR, step=name, attempt=step.attempts, error=str(e))
+            self._check_ready()
+            return False
+        finally:
+            step.seconds = time.perf_counter() - started
+        step.state, step.error = "ready", None
+        log_event("warmup_step_ready", step=name, seconds=round(step.seconds, 3))
+        self._check_ready()
+        return True
+
+    def _state(self, name: str) -> str:
+        step = self.steps.get(name)
+        return step.state if step else "pending"
+
+    def _check_ready(self):
+        if self.ready_after is None and self.ready:
+            self.ready_after = time.monotonic() - self.started
+            log_event("ready", seconds=round(self.ready_after, 3))
+
+    @property
+    def ready(self) -> bool:
+        if self.ready_after is not None:
+            return True
+        for name in self.required_steps():
+            state = self._state(name)
+            # Retrieval serves turns while the context cache is retried.
+            if name == "context_cache" and state == "failed" and self._state("document") == "ready":
+                continue
+            if state != "ready":
+                return False
+        return True
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": time.monotonic() - self.started,
+            "ready_after_seconds": self.ready_after,
+            "steps": {name: self._step_status(name) for name in self.required_steps()},
+        }
+
+    def _step_status(self, name: str) -> dict:
+        step = self.steps.get(name) or Step()
+        return {"state": step.state, "seconds": step.seconds, "attempts": step.attempts, "error": step.error}
+
+readiness = Readiness()
@@ -0,0 +1,110 @@
+import re
+from dataclasses import dataclass
+from app.config import settings
+from app.services.text_index import TfidfIndex
+from app.services.telemetry import log_event
+
+SECTION_HEADING = re.compile(r"^(#{1,2})\s+(.*)")
+# Used when the document has no Markdown headings (e.g. text extracted from the PDF).
+FALLBACK_CHUNK_CHARS = 2000
+
+@dataclass
+class Section:
+    title: str
+    text: str
+
+def chunk_sections(text: str) -> list[Section]:
+    # Splits the document on # and ## headings; deeper headings stay inside their ## section.
+    sections = []
+    parent = title = ""
+    lines = []
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if body:
+            sections.append(Section(title, body))
+
+    for line in text.splitlines():
+        heading = SECTION_HEADING.match(line.strip())
+        if heading:
+            flush()
+            lines = [line]
+            if len(heading.group(1)) == 1:
+                parent = title = heading.group(2).strip()
+            else:
+                title = f"{parent} > {heading.group(2).strip()}" if parent else heading.group(2).strip()
+        else:
+            lines.append(line)
+    flush()
+
+    if len(sections) > 1:
+        return sections
+    return chunk_paragraphs(text)
+
+def chunk_paragraphs(text: str) -> list[Section]:
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        if current and len(current) + len(paragraph) > FALLBACK_CHUNK_CHARS:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current.strip():
+        chunks.append(current)
+    return [Section(f"part {i + 1}", chunk.strip()) for i, chunk in enumerate(chunks)]
+
+class SectionIndex(TfidfIndex):
+    """TF-IDF index over the document's sections, used to build per-turn context."""
+
+    def __init__(self, sections: list[Section]):
+        super().__init__([f"{section.title}\n{section.text}" for section in sections])
+        self.sections = sections
+        self.document_chars = sum(len(section.text) for section in sections)
+
+    def context_for(self, query: str, k: int) -> tuple[str, int]:
+        # Returns the top-k sections in document order, and their size in characters.
+        rows = sorted(row for row, score in self.top_k(query, k) if score > 0)
+        selected = [self.sections[row].text for row in rows]
+        return "\n\n".join(selected), sum(len(text) for text in selected)
+
+class RetrievalStats:
+    """Prompt tokens spent in retrieval mode, compared with sending the whole document."""
+
+    def __init__(self):
+        self.document_tokens = None  # Tokens of the full document, counted once at startup
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.context_chars = 0
+
+    def record(self, prompt_tokens: int, context_chars: int):
+        self.turns += 1
+        self.prompt_tokens += prompt_tokens
+        self.context_chars += context_chars
+
+    def summary(self) -> dict:
+        summary = {
+            "mode": settings.CONTEXT_MODE,
+            "top_k": settings.RETRIEVAL_TOP_K,
+            "sections": len(section_index.sections) if section_index else 0,
+            "document_tokens": self.document_tokens,
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "estimated_cached_mode_prompt_tokens": None,
+            "estimated_tokens_saved": None,
+        }
+        if self.document_tokens and section_index and section_index.document_chars:
+            # Context tokens are estimated from their share of the document's characters.
+            context_tokens = self.document_tokens * self.context_chars / section_index.document_chars
+            cached_mode_tokens = self.prompt_tokens - context_tokens + self.turns * self.document_tokens
+            summary["estimated_cached_mode_prompt_tokens"] = round(cached_mode_tokens)
+            summary["estimated_tokens_saved"] = round(cached_mode_tokens - self.prompt_tokens)
+        return summary
+
+section_index: SectionIndex | None = None
+retrieval_stats = RetrievalStats()
+
+def build_section_index(text: str) -> SectionIndex:
+    global section_index
+    section_index = SectionIndex(chunk_sections(text))
+    log_event("retrieval_index_built", sections=len(section_index.sections))
+    return section_index
@@ -0,0 +1,38 @@
+"""JSON encoding of documents read from MongoDB, with orjson.
+
+orjson encodes datetimes (as ISO 8601, like FastAPI's encoder) natively, and
+ObjectIds are encoded as strings, so documents from Mongo can be returned
+as-is: read endpoints return a FastJSONResponse instead of going through
+response_model validation and jsonable_encoder, which would rebuild every
+document as a Pydantic model first.
+"""
+import orjson
+from fastapi.responses import Response
+from app.models import Message
+
+# Fields of a Message that may be missing from a stored message, with the value
+# the Message model would give them.
+MESSAGE_DEFAULTS = {
+    name: field.default for name, field in Message.model_fields.items()
+    if not field.is_required() and field.default_factory is None and name != "id"
+}
+
+def json_default(value):
+    # ObjectId (or anything else orjson does not know) as str
+    return str(value)
+
+def dumps(data) -> bytes:
+    return orjson.dumps(data, default=json_default)
+
+def ndjson_line(data) -> bytes:
+    return orjson.dumps(data, default=json_default, option=orjson.OPT_APPEND_NEWLINE)
+
+def message_fields(message: dict) -> dict:
+    # A stored message with the fields the Message model would fill in.
+    return {**MESSAGE_DEFAULTS, **message}
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
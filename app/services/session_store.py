@@ -0,0 +1,91 @@
+"""Where chat session state lives, so it can be shared by workers and replicas.
+
+The SDK chat object itself cannot be shared; each worker keeps its own in
+ChatSessionManager and rebuilds it from the persisted conversation messages.
+What a store shares is the session's metadata: its conversation, request count
+and last activity.
+"""
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from app.config import settings
+from app.services.mongodb import MongoDBClient
+
+class InMemorySessionStore:
+    """Process-local sessions: ChatSessionManager's own state is the source of truth."""
+
+    async def ensure_indexes(self):
+        pass
+
+    async def get(self, user_id: str):
+        return None
+
+    async def create(self, user_id: str, conversation_id: str, request_count: int = 0):
+        pass
+
+    async def record_request(self, user_id: str, conversation_id: str):
+        return None
+
+    async def delete(self, user_id: str):
+        pass
+
+class MongoSessionStore:
+    """Sessions shared through a MongoDB collection, one document per user.
+
+    {"_id": user_id, "conversation_id": str, "start_time": datetime,
+     "last_message_time": datetime, "request_count": int, "expires_at": datetime}
+
+    A TTL index on expires_at removes expired sessions; reads also check it, as
+    the TTL monitor only runs about once a minute.
+    """
+
+    collection_name = "chat_sessions"
+
+    @property
+    def collection(self):
+        return MongoDBClient.get_database()[self.collection_name]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, user_id: str):
+        return await self.collection.find_one({"_id": user_id, "expires_at": {"$gt": datetime.utcnow()}})
+
+    async def create(self, user_id: str, conversation_id: str, request_count: int = 0):
+        # Starts (or replaces) the user's session, bound to conversation_id.
+        now = datetime.utcnow()
+        session = {
+            "_id": user_id,
+            "conversation_id": conversation_id,
+            "start_time": now,
+            "last_message_time": now,
+            "request_count": request_count,
+            "expires_at": now + timedelta(seconds=settings.MAX_DURATION_AFTER_LAST_MESSAGE),
+        }
+        await self.collection.replace_one({"_id": user_id}, session, upsert=True)
+        return session
+
+    async def record_request(self, user_id: str, conversation_id: str):
+        # Counts a request against the user's live session, starting a new session
+        # bound to conversation_id when there is none. Returns the session document.
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=settings.MAX_DURATION_AFTER_LAST_MESSAGE)
+        session = await self.collection.find_one_and_update(
+            {"_id": user_id, "expires_at": {"$gt": now}},
+            {"$inc": {"request_count": 1}, "$set": {"last_message_time": now, "expires_at": expires_at}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if session is None:
+            session = await self.create(user_id, conversation_id, request_count=1)
+        return session
+
+    async def delete(self, user_id: str):
+        await self.collection.delete_one({"_id": user_id})
+
+def get_session_store():
+    if settings.SESSION_STORE == "mongodb":
+        return MongoSessionStore()
+    if settings.SESSION_STORE == "memory":
+        return InMemorySessionStore()
+    raise ValueError(f"Unsupported session store: {settings.SESSION_STORE}")
+
+session_store = get_session_store()
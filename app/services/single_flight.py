@@ -0,0 +1,52 @@
+import asyncio
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one call.
+
+    The first caller for a key (the leader) starts the call as its own task;
+    callers arriving while it is in flight (followers) wait for that task and
+    share its result or exception. The task is shielded, so a leader whose
+    request is cancelled does not cancel the call its followers wait on.
+    """
+
+    def __init__(self):
+        self._calls: dict[object, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.max_followers = 0
+        self._waiting: dict[object, int] = {}
+
+    async def do(self, key, call):
+        """Return (result of call(), shared), where shared is True for followers."""
+        task = self._calls.get(key)
+        if task is not None:
+            self.followers += 1
+            self._waiting[key] += 1
+            self.max_followers = max(self.max_followers, self._waiting[key])
+            return await asyncio.shield(task), True
+
+        self.leaders += 1
+        task = asyncio.ensure_future(call())
+        self._calls[key] = task
+        self._waiting[key] = 0
+        task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task), False
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiting[key]
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            # Share of calls answered by another call's result, i.e. Gemini calls saved.
+            "coalescing_ratio": self.followers / calls if calls else 0.0,
+            "max_followers": self.max_followers,
+        }
+
+# First-turn questions, keyed on (context name, normalized question).
+first_turn_flights = SingleFlight()
@@ -0,0 +1,210 @@
+"""Metrics in the Prometheus text format, and structured logging.
+
+Metrics are plain in-process counters and histograms, rendered by
+render_metrics() for the /metrics endpoint. Updating one is a dict lookup and
+a few additions, cheap enough for every request.
+
+Log records are single-line JSON objects, built only when the logger is
+enabled for the record's level.
+"""
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+logger = logging.getLogger("bemo")
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, ensure_ascii=False, default=str))
+
+_registry = []
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        _registry.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(child.render(self.name, format_labels(self.labelnames, values)))
+        return lines
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def render(self, name: str, labels: str) -> list[str]:
+        return [f"{name}{labels} {self.value}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(list(self.bounds) + ["+Inf"], self.counts):
+            total += count
+            yield str(bound), total
+
+    def snapshot(self) -> dict:
+        return {"buckets": dict(self.cumulative()), "count": self.count, "sum": self.sum}
+
+    def render(self, name: str, labels: str) -> list[str]:
+        prefix = labels[:-1] + "," if labels else "{"
+        lines = [f'{name}_bucket{prefix}le="{bound}"}} {total}' for bound, total in self.cumulative()]
+        lines.append(f"{name}_sum{labels} {self.sum}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+class Gauge(Metric):
+    """A value read when metrics are rendered, from a function per label set."""
+
+    kind = "gauge"
+
+    def set_function(self, function, *values):
+        self._children[values] = function
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, function in self._children.items():
+            lines.append(f"{self.name}{format_labels(self.labelnames, values)} {function()}")
+        return lines
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+STAGE_SECONDS = Histogram(
+    "bemo_stage_seconds", "Time spent in each hot-path stage of a request.", ["stage"]
+)
+HTTP_REQUESTS = Counter(
+    "bemo_http_requests_total", "HTTP requests by route, method and status code.", ["route", "method", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "bemo_http_request_seconds", "HTTP request latency by route.", ["route", "method"]
+)
+GEMINI_TOKENS = Counter(
+    "bemo_gemini_tokens_total", "Tokens billed by Gemini, by kind (prompt or response).", ["kind"]
+)
+GEMINI_TOKENS_PER_SECOND = Histogram(
+    "bemo_gemini_response_tokens_per_second", "Response tokens per second of call time, per Gemini turn.",
+    buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600),
+)
+CONTEXT_CACHE_EVENTS = Counter(
+    "bemo_context_cache_events_total", "Context cache lifecycle and per-turn events.", ["event"]
+)
+ACTIVE_SESSIONS = Gauge("bemo_active_chat_sessions", "Chat sessions held by this worker.")
+
+class RequestMetricsMiddleware:
+    """ASGI middleware counting requests and their latency per route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500  # Unless a response starts, the request failed
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route else "unmatched"
+            HTTP_REQUESTS.labels(path, scope["method"], status).inc()
+            HTTP_REQUEST_SECONDS.labels(path, scope["method"]).observe(time.perf_counter() - started)
+
+async def timed(stage: str, awaitable):
+    # Awaits `awaitable`, recording its duration under the given stage.
+    with STAGE_SECONDS.labels(stage).time():
+        return await awaitable
+
+async def to_thread(func, *args):
+    # asyncio.to_thread, recording how long the call waited for a free worker thread.
+    submitted = time.perf_counter()
+    started = None
+
+    def run():
+        nonlocal started
+        started = time.perf_counter()
+        return func(*args)
+
+    try:
+        return await asyncio.to_thread(run)
+    finally:
+        if started is not None:
+            STAGE_SECONDS.labels("to_thread_wait").observe(started - submitted)
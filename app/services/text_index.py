@@ -0,0 +1,55 @@
+import numpy as np
+from app.services.answer_cache import normalize_question
+
+def char_ngrams(text: str, n: int) -> list[str]:
+    grams = []
+    for word in normalize_question(text).split():
+        padded = f" {word} "
+        if len(padded) <= n:
+            grams.append(padded)
+        else:
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+class TfidfIndex:
+    """TF-IDF index over character n-grams of a list of texts.
+
+    Rows of the matrix are L2-normalised, so cosine similarity against a query
+    is a single matrix-vector product.
+    """
+
+    def __init__(self, texts: list[str], ngram_size: int = 3):
+        self.size = len(texts)
+        self.ngram_size = ngram_size
+        self.vocabulary: dict[str, int] = {}
+        documents = [char_ngrams(text, ngram_size) for text in texts]
+        for grams in documents:
+            for gram in grams:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+
+        counts = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, grams in enumerate(documents):
+            np.add.at(counts[row], [self.vocabulary[gram] for gram in grams], 1.0)
+        document_frequency = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        self.matrix = self._normalize(counts * self.idf)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def vectorize(self, query: str) -> np.ndarray:
+        ids = [self.vocabulary[gram] for gram in char_ngrams(query, self.ngram_size) if gram in self.vocabulary]
+        vector = np.bincount(ids, minlength=len(self.vocabulary)).astype(np.float32) * self.idf
+        return self._normalize(vector)
+
+    def top_k(self, query: str, k: int) -> list[tuple[int, float]]:
+        # Returns (row, cosine score) pairs for the k best rows, best first.
+        if not self.size:
+            return []
+        scores = self.matrix @ self.vectorize(query)
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
@@ -0,0 +1,205 @@
+"""Token usage analytics from daily rollups.
+
+Every saved turn also adds its tokens to one rollup document per user, UTC day
+and model, with an atomic $inc upsert issued alongside the conversation's own
+counters:
+
+    {"_id": "<user_id>:<YYYY-MM-DD>:<model>", "user_id": str, "day": datetime,
+     "model": str, "prompt_tokens": int, "response_tokens": int,
+     "total_tokens": int, "turns": int, "gemini_turns": int}
+
+Turns answered without a Gemini call (answer cache, FAQ index, coalesced
+requests) are rolled up under the model "local". Analytics queries $group the
+rollups of a date range, so their cost grows with days x users rather than
+with messages. rebuild_rollups() recomputes the rollups of a date range from
+the stored messages, e.g. to backfill turns saved before rollups existed.
+"""
+from datetime import date, datetime, time, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING, ReplaceOne
+from app.config import settings
+from app.services.mongodb import MongoDBClient
+from app.services.context_caches import parse_documents, is_default_document
+from app.services.write_buffer import WriteBehindBuffer
+from app.services.telemetry import STAGE_SECONDS, log_event
+
+ROLLUP_COLLECTION = "token_usage_daily"
+LOCAL_MODEL = "local"
+USAGE_FIELDS = ("prompt_tokens", "response_tokens", "total_tokens", "turns", "gemini_turns")
+# Group keys of the analytics queries.
+GROUP_KEYS = {"day": "$day", "user_id": "$user_id", "model": "$model"}
+
+rollup_writes = WriteBehindBuffer(
+    ROLLUP_COLLECTION, settings.MONGO_WRITE_BEHIND_MAX_BATCH, settings.MONGO_WRITE_BEHIND_INTERVAL
+)
+
+def collection():
+    return MongoDBClient.get_database()[ROLLUP_COLLECTION]
+
+async def ensure_indexes():
+    # Date range queries across users, and one user's days.
+    await collection().create_index([("day", ASCENDING), ("user_id", ASCENDING)])
+    await collection().create_index([("user_id", ASCENDING), ("day", ASCENDING)])
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+def rollup_id(user_id: str, day: datetime, model: str) -> str:
+    return f"{user_id}:{day:%Y-%m-%d}:{model}"
+
+def rollup_update(user_id: str, model: str, prompt_tokens: int, response_tokens: int, total_tokens: int, gemini_turn: bool, now: datetime = None, turns: int = 1):
+    # Filter and upsert update adding `turns` turns to their user/day/model rollup.
+    day = day_start((now or datetime.utcnow()).date())
+    rollup_filter = {"_id": rollup_id(user_id, day, model)}
+    update = {
+        "$inc": {
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "total_tokens": total_tokens,
+            "turns": turns,
+            "gemini_turns": turns if gemini_turn else 0,
+        },
+        "$setOnInsert": {"user_id": user_id, "day": day, "model": model},
+    }
+    return rollup_filter, update
+
+async def record_turn(user_id: str, prompt_tokens: int, response_tokens: int, total_tokens: int, gemini_turn: bool, model: str = None, turns: int = 1):
+    model = (model or settings.GEMINI_MODEL_NAME) if gemini_turn else LOCAL_MODEL
+    rollup_filter, update = rollup_update(user_id, model, prompt_tokens, response_tokens, total_tokens, gemini_turn, turns=turns)
+    if settings.MONGO_WRITE_BEHIND:
+        await rollup_writes.add(rollup_filter, update, upsert=True)
+    else:
+        with STAGE_SECONDS.labels("mongo_update_one_rollup").time():
+            await collection().update_one(rollup_filter, update, upsert=True)
+
+async def usage(group_by: list[str], start: date, end: date, user_id: str = None, model: str = None, sort: dict = None, limit: int = None) -> list[dict]:
+    """Token totals of the days from `start` to `end` (inclusive), grouped by the
+    rollup fields in `group_by` (any of "day", "user_id", "model")."""
+    match = {"day": {"$gte": day_start(start), "$lt": day_start(end) + timedelta(days=1)}}
+    if user_id is not None:
+        match["user_id"] = user_id
+    if model is not None:
+        match["model"] = model
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {key: GROUP_KEYS[key] for key in group_by},
+            **{field: {"$sum": f"${field}"} for field in USAGE_FIELDS},
+        }},
+        {"$sort": sort or {f"_id.{key}": 1 for key in group_by}},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    with STAGE_SECONDS.labels("mongo_aggregate_token_usage").time():
+        rows = await collection().aggregate(pipeline).to_list(length=None)
+    return [{**row.pop("_id"), **row} for row in rows]
+
+def document_models() -> dict[str, str]:
+    # Models of the CONTEXT_DOCUMENTS that differ from GEMINI_MODEL_NAME, by document name.
+    documents = parse_documents(settings.CONTEXT_DOCUMENTS)
+    return {
+        name: document.model for name, document in documents.items()
+        if not is_default_document(name) and document.model != settings.GEMINI_MODEL_NAME
+    }
+
+def conversation_model(document_field: str):
+    # Aggregation expression of the model answering a conversation, from its document field.
+    branches = [{"case": {"$eq": [document_field, name]}, "then": model} for name, model in document_models().items()]
+    if not branches:
+        return settings.GEMINI_MODEL_NAME
+    return {"$switch": {"branches": branches, "default": settings.GEMINI_MODEL_NAME}}
+
+async def rebuild_rollups(start: date, end: date) -> int:
+    """Recompute the rollups of the days from `start` to `end` (inclusive) from the
+    stored model messages and return how many rollup documents were written.
+
+    Turns saved while the rebuild runs may be counted twice or not at all for
+    those days, so run it for past days. Stored messages do not record the
+    model, so Gemini turns are attributed to the current model of their
+    conversation's document (see CONTEXT_DOCUMENTS).
+    Messages of archived conversations are decompressed and added up here.
+    Rollups of evaluation runs are kept as they are: no stored message backs them.
+    """
+    from app.services.message_store import BUCKETS_COLLECTION
+    from app.services.evaluation import EVALUATION_USER_ID
+    db = MongoDBClient.get_database()
+    range_start, range_end = day_start(start), day_start(end) + timedelta(days=1)
+    local_answer = {"$or": [
+        {"$eq": ["$messages.cached", True]},
+        {"$gt": ["$messages.faq_score", None]},
+        {"$eq": ["$messages.coalesced", True]},
+    ]}
+    pipeline = [
+        # Buckets holding any message of the range, by their message id bounds.
+        {"$match": {
+            "last_id": {"$gte": ObjectId.from_datetime(range_start)},
+            "first_id": {"$lt": ObjectId.from_datetime(range_end)},
+        }},
+        {"$unwind": "$messages"},
+        {"$match": {"messages.role": "model", "messages.timestamp": {"$gte": range_start, "$lt": range_end}}},
+        {"$lookup": {"from": "conversations", "localField": "conversation_id", "foreignField": "_id", "as": "conversation"}},
+        {"$unwind": "$conversation"},
+        {"$group": {
+            "_id": {
+                "user_id": "$conversation.user_id",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$messages.timestamp"}},
+                "model": {"$cond": [local_answer, LOCAL_MODEL, conversation_model("$conversation.document")]},
+            },
+            "prompt_tokens": {"$sum": {"$ifNull": ["$messages.prompt_token_count", 0]}},
+            "response_tokens": {"$sum": {"$ifNull": ["$messages.token_count", 0]}},
+            "turns": {"$sum": 1},
+            "gemini_turns": {"$sum": {"$cond": [local_answer, 0, 1]}},
+        }},
+    ]
+    rollups = {}
+    async for row in db[BUCKETS_COLLECTION].aggregate(pipeline, allowDiskUse=True):
+        key = row.pop("_id")
+        rollups[key["user_id"], key["day"], key["model"]] = row
+    await add_archived_turns(db, rollups, range_start, range_end)
+    replacements = []
+    for (user_id, day, model), row in rollups.items():
+        day = datetime.strptime(day, "%Y-%m-%d")
+        replacements.append(ReplaceOne(
+            {"_id": rollup_id(user_id, day, model)},
+            {
+                "user_id": user_id, "day": day, "model": model,
+                "total_tokens": row["prompt_tokens"] + row["response_tokens"], **row,
+            },
+            upsert=True,
+        ))
+    await collection().delete_many({"day": {"$gte": range_start, "$lt": range_end}, "user_id": {"$ne": EVALUATION_USER_ID}})
+    if replacements:
+        await collection().bulk_write(replacements, ordered=False)
+    written = len(replacements)
+    log_event("token_rollups_rebuilt", start=start, end=end, rollups=written)
+    return written
+
+async def add_archived_turns(db, rollups: dict, range_start: datetime, range_end: datetime):
+    # Adds the model messages of the range held in archive chunks to `rollups`,
+    # keyed like the $group of rebuild_rollups.
+    from app.services import archive
+    models = document_models()
+    conversation_models = {}
+    chunks = db[archive.ARCHIVE_COLLECTION].find(
+        {"last_id": {"$gte": ObjectId.from_datetime(range_start)}, "first_id": {"$lt": ObjectId.from_datetime(range_end)}},
+        {"conversation_id": 1, "user_id": 1, "messages": 1},
+    )
+    async for chunk in chunks:
+        conversation_id = chunk["conversation_id"]
+        if models and conversation_id not in conversation_models:
+            conversation = await db.conversations.find_one({"_id": conversation_id}, {"document": 1}) or {}
+            conversation_models[conversation_id] = models.get(conversation.get("document"), settings.GEMINI_MODEL_NAME)
+        gemini_model = conversation_models.get(conversation_id, settings.GEMINI_MODEL_NAME)
+        for message in archive.decompress_messages(chunk["messages"]):
+            if message["role"] != "model" or not range_start <= message["timestamp"] < range_end:
+                continue
+            local = bool(message.get("cached") or message.get("faq_score") is not None or message.get("coalesced"))
+            model = LOCAL_MODEL if local else gemini_model
+            row = rollups.setdefault(
+                (chunk["user_id"], f"{message['timestamp']:%Y-%m-%d}", model),
+                {"prompt_tokens": 0, "response_tokens": 0, "turns": 0, "gemini_turns": 0},
+            )
+            row["prompt_tokens"] += message.get("prompt_token_count") or 0
+            row["response_tokens"] += message.get("token_count") or 0
+            row["turns"] += 1
+            row["gemini_turns"] += 0 if local else 1
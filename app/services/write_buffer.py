@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from pymongo import UpdateOne
+from app.config import settings
+from app.services.mongodb import MongoDBClient
+from app.services.telemetry import STAGE_SECONDS, log_event
+
+class WriteBehindBuffer:
+    """Buffers conversation updates and flushes them with one ordered bulk_write.
+
+    A flush happens every `interval` seconds (see `run`), as soon as
+    `max_batch` updates are pending, and on shutdown. Flushes are serialized
+    so updates to the same conversation are applied in the order they were added.
+    """
+
+    def __init__(self, collection_name: str, max_batch: int, interval: float):
+        self.collection_name = collection_name
+        self.max_batch = max_batch
+        self.interval = interval
+        self._pending: list[UpdateOne] = []
+        self._flush_lock = asyncio.Lock()
+        self.flushed = 0
+        self.failed = 0
+
+    async def add(self, filter: dict, update: dict, upsert: bool = False):
+        self._pending.append(UpdateOne(filter, update, upsert=upsert))
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            collection = MongoDBClient.get_database()[self.collection_name]
+            try:
+                with STAGE_SECONDS.labels("mongo_bulk_write").time():
+                    await collection.bulk_write(batch, ordered=True)
+                self.flushed += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                log_event("write_behind_flush_failed", logging.ERROR, collection=self.collection_name, writes=len(batch), error=str(e))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+turn_writes = WriteBehindBuffer(
+    "conversations", settings.MONGO_WRITE_BEHIND_MAX_BATCH, settings.MONGO_WRITE_BEHIND_INTERVAL
+)
@@ -0,0 +1,141 @@
+"""Latency of GET /conversations/user/{user_id}: original query vs indexed summary listing.
+
+Seeds a scratch database, on a local MongoDB or an in-memory stand-in
+(mongomock-motor, `pip install mongomock-motor`), with many conversations,
+then times
+
+- "original": find({"user_id": ...}) with no index, projection, sort or limit,
+  building a full Conversation (with inline messages) per document, as the
+  endpoint used to;
+- "endpoint": GET /api/conversations/user/{user_id}?limit=--limit on the app
+  itself, run in process through httpx's ASGI transport, so the numbers follow
+  the listing code that ships (query, index and response encoding).
+
+Run from the repository root:
+
+    python -m benchmarks.conversation_listing_benchmark --conversations 2000 --messages 40
+    python -m benchmarks.conversation_listing_benchmark --mongo memory
+
+The scratch database is dropped at the end unless --keep is passed.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+import httpx
+from app.config import settings
+from app.models import Conversation
+from app.services.mongodb import MongoDBClient
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def seed_conversation(user_id: str, messages: int, started: datetime) -> dict:
+    # Inline messages, as conversations were stored before message buckets.
+    inline = [
+        {
+            "role": "user" if i % 2 == 0 else "model",
+            "content": "ما هي شروط القرض الشخصي؟ " * 8,
+            "timestamp": started + timedelta(seconds=i * 30),
+            "token_count": None if i % 2 == 0 else 120,
+        }
+        for i in range(messages)
+    ]
+    return {
+        "user_id": user_id,
+        "messages": inline,
+        "message_count": messages,
+        "start_time": started,
+        "last_message_time": started + timedelta(seconds=messages * 30),
+        "total_token_count": messages * 500,
+    }
+
+async def seed(db, users: int, conversations: int, messages: int):
+    now = datetime.utcnow()
+    batch = []
+    for i in range(conversations):
+        started = now - timedelta(minutes=random.randint(0, 60 * 24 * 90))
+        batch.append(seed_conversation(f"user-{i % users}", messages, started))
+        if len(batch) == 500:
+            await db.conversations.insert_many(batch)
+            batch = []
+    if batch:
+        await db.conversations.insert_many(batch)
+
+async def list_original(db, user_id: str):
+    conversations = []
+    async for conv in db.conversations.find({"user_id": user_id}):
+        conv["_id"] = str(conv["_id"])
+        conversations.append(Conversation(**conv))
+    return conversations
+
+async def list_endpoint(client: httpx.AsyncClient, user_id: str, limit: int):
+    response = await client.get(f"/api/conversations/user/{user_id}", params={"limit": limit})
+    response.raise_for_status()
+    return response.json()
+
+def use_database(args):
+    # Must run before the app first asks MongoDBClient for a connection.
+    if args.mongo == "memory":
+        from mongomock_motor import AsyncMongoMockClient
+        MongoDBClient._client = AsyncMongoMockClient()
+    else:
+        import motor.motor_asyncio
+        MongoDBClient._client = motor.motor_asyncio.AsyncIOMotorClient(args.mongo)
+    settings.MONGODB_DB = args.db
+
+async def time_calls(call, users: int, rounds: int):
+    latencies = []
+    for i in range(rounds):
+        started = time.perf_counter()
+        await call(f"user-{i % users}")
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+def report(name, latencies):
+    print(
+        f"{name:>10}: mean {statistics.mean(latencies):8.2f} ms, p50 {percentile(latencies, 50):8.2f} ms, "
+        f"p95 {percentile(latencies, 95):8.2f} ms, p99 {percentile(latencies, 99):8.2f} ms"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default=settings.MONGODB_URI or "mongodb://localhost:27017", help='A MongoDB URI or "memory"')
+    parser.add_argument("--db", default="chat_listing_benchmark")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=40, help="Inline messages per seeded conversation")
+    parser.add_argument("--limit", type=int, default=50, help="Page size of the summary listing")
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded database")
+    args = parser.parse_args()
+
+    use_database(args)
+    from app.main import app
+    # One log line per request would dominate the measurement.
+    logging.getLogger("bemo").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    db = MongoDBClient.get_database()
+    await MongoDBClient.get_client().drop_database(args.db)
+    print(f"Seeding {args.conversations} conversations x {args.messages} messages for {args.users} users...")
+    await seed(db, args.users, args.conversations, args.messages)
+
+    original = await time_calls(lambda user_id: list_original(db, user_id), args.users, args.rounds)
+    await MongoDBClient.ensure_indexes()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://listing-benchmark") as client:
+        endpoint = await time_calls(lambda user_id: list_endpoint(client, user_id, args.limit), args.users, args.rounds)
+
+    print(f"{args.conversations // args.users} conversations per user, page size {args.limit}, {args.rounds} rounds")
+    report("original", original)
+    report("endpoint", endpoint)
+
+    if not args.keep:
+        await MongoDBClient.get_client().drop_database(args.db)
+
+if __name__ == "__main__":
+    asyncio.run(main())
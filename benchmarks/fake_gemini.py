@@ -0,0 +1,136 @@
+"""A stand-in for GeminiClient that never calls the Gemini API.
+
+install_fake_gemini() puts a FakeGeminiClient in place of the GeminiClient
+singleton, so every `GeminiClient()` in the app returns it. Chats answer after
+a configurable latency with configurable token counts, and stream their answer
+in a configurable number of chunks. Everything else (the scheduler, history
+policies, token accounting) is the real GeminiClient code.
+"""
+import asyncio
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from google.genai import types
+from app.config import settings
+from app.services.gemini_client import GeminiClient
+from app.services.context_caches import CacheKey, DEFAULT_DOCUMENT
+
+@dataclass
+class FakeGeminiProfile:
+    latency: float = 0.5  # Mean seconds per call
+    jitter: float = 0.1  # Standard deviation of the latency
+    prompt_tokens: int = 30000  # Prompt tokens of a first turn (the cached document dominates)
+    tokens_per_history_message: int = 60  # Extra prompt tokens per message already in the chat
+    response_tokens: int = 120
+    chunks: int = 8  # Chunks a streamed answer is split into
+    cache_latency: float = 2.0  # Seconds to find or create the context cache at startup
+    seed: int = 0
+
+class FakeChat:
+    """Implements the part of google.genai's AsyncChat the app uses."""
+
+    def __init__(self, profile: FakeGeminiProfile, rng: random.Random, history=None):
+        self.profile = profile
+        self.rng = rng
+        self.history = list(history or [])
+
+    def get_history(self, curated: bool = False):
+        return list(self.history)
+
+    def record_history(self, user_input, model_output, is_valid):
+        self.history.append(user_input)
+        self.history.extend(model_output)
+
+    def _latency(self) -> float:
+        return max(0.0, self.rng.gauss(self.profile.latency, self.profile.jitter))
+
+    def _answer(self, message: str):
+        text = f"إجابة تجريبية على: {message} " + "نص " * self.profile.response_tokens
+        usage = SimpleNamespace(
+            prompt_token_count=self.profile.prompt_tokens + self.profile.tokens_per_history_message * len(self.history),
+            candidates_token_count=self.profile.response_tokens,
+            total_token_count=None,
+        )
+        usage.total_token_count = usage.prompt_token_count + usage.candidates_token_count
+        return text, usage
+
+    def _record(self, message: str, text: str):
+        self.record_history(
+            types.Content(role="user", parts=[types.Part(text=message)]),
+            [types.Content(role="model", parts=[types.Part(text=text)])],
+            True,
+        )
+
+    async def send_message(self, message: str, config=None):
+        await asyncio.sleep(self._latency())
+        text, usage = self._answer(message)
+        self._record(message, text)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    async def send_message_stream(self, message: str, config=None):
+        text, usage = self._answer(message)
+        chunk_count = max(1, self.profile.chunks)
+        size = -(-len(text) // chunk_count)
+        delay = self._latency() / chunk_count
+
+        async def stream():
+            for i in range(chunk_count):
+                await asyncio.sleep(delay)
+                last = i == chunk_count - 1
+                yield SimpleNamespace(text=text[i * size:(i + 1) * size], usage_metadata=usage if last else None)
+            self._record(message, text)
+
+        return stream()
+
+class FakeGeminiClient(GeminiClient):
+    def __init__(self, profile: FakeGeminiProfile = None, *args, **kwargs):
+        # GeminiClient() calls this again on the singleton, without a profile.
+        if getattr(self, "profile", None) is not None:
+            return
+        super().__init__(file_ext="md")
+        self.profile = profile
+        self.rng = random.Random(profile.seed)
+        self.created_caches = 0
+        self.contexts.metadata_file = None  # Fake caches are not saved
+        self.contexts.put(DEFAULT_DOCUMENT, CacheKey("fake", settings.GEMINI_MODEL_NAME, "fake"), self.fake_cache())
+
+    def fake_cache(self, model: str = None):
+        now = datetime.now(timezone.utc)
+        self.created_caches += 1
+        return SimpleNamespace(
+            name=f"cachedContents/fake-{self.created_caches}",
+            model=f"models/{model or settings.GEMINI_MODEL_NAME}",
+            display_name="Fake cache",
+            create_time=now,
+            update_time=now,
+            expire_time=now + timedelta(days=1),
+        )
+
+    async def initialize_cache(self, document_text=None):
+        await asyncio.sleep(self.profile.cache_latency)
+        return self.cache
+
+    async def create_cache(self, file_text: str, model: str = None):
+        # Caches of the other CONTEXT_DOCUMENTS, created on first use.
+        await asyncio.sleep(self.profile.cache_latency)
+        return self.fake_cache(model)
+
+    async def count_document_tokens(self, document_text: str):
+        await asyncio.sleep(self.profile.latency)
+        return self.profile.prompt_tokens
+
+    def create_chat(self, history=None, document: str = None):
+        return FakeChat(self.profile, self.rng, history)
+
+    async def summarize_turns(self, turns, user_id: str = None):
+        await asyncio.sleep(self.profile.latency)
+        return "ملخص تجريبي", self.profile.response_tokens
+
+def install_fake_gemini(profile: FakeGeminiProfile = None) -> FakeGeminiClient:
+    # The SDK client is still constructed, but never used; it only needs some key.
+    settings.GEMINI_API_KEY = settings.GEMINI_API_KEY or "offline"
+    GeminiClient._instance = FakeGeminiClient._instance = None
+    client = FakeGeminiClient(profile or FakeGeminiProfile())
+    GeminiClient._instance = client
+    return client
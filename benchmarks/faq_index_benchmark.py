@@ -0,0 +1,104 @@
+"""Lookup latency of the FAQ index over every question in the document.
+
+Run from the repository root:
+
+    python -m benchmarks.faq_index_benchmark [path/to/info.md] [--rounds N]
+
+Each FAQ question is queried verbatim and with its diacritics-free,
+punctuation-free variant; the script reports per-query latency percentiles,
+top-1 accuracy and how many queries clear FAQ_MATCH_THRESHOLD.
+
+Verbatim questions always find themselves, so the script also queries a
+small set of paraphrases, the way customers actually ask, and reports how
+many find their FAQ entry and how many of those clear the threshold, i.e.
+would be answered from the FAQ instead of by Gemini.
+"""
+import argparse
+import pathlib
+import statistics
+import time
+from app.config import settings
+from app.services.answer_cache import normalize_question
+from app.services.faq_index import FaqIndex
+
+# (customer phrasing, the FAQ question it should match)
+PARAPHRASES = [
+    ("كيف أنزل تطبيق البنك على موبايلي؟", "ما هي طريقة تحميل التطبيق الإلكتروني؟"),
+    ("شو العمولة للاشتراك بالخدمات الالكترونية؟", "ماهي عمولة الاشتراك بالخدمات المصرفية الإلكترونية؟"),
+    ("نسيت كلمة السر للتطبيق شو لازم أعمل؟", "ما هي خطوات  تغيير كلمة المرور للتطبيق أو للموقع الالكتروني ( في حال النسيان ، انتهاء صلاحية )؟"),
+    ("ضاع موبايلي، ماذا أفعل بخصوص الخدمات المصرفية الالكترونية؟", "ماهي الإجراءات الواجب اتباعها في حال فقدان جهاز الموبايل بالنسبة للخدمات المصرفية الالكترونية؟"),
+    ("ما هي الأوراق اللازمة لفتح حساب؟", "الأوراق المطلوبة لفتح الحساب؟"),
+    ("بدي سكر حسابي بالبنك كيف؟", "كيف يمكن إغلاق الحساب؟"),
+    ("ما هو الحساب الرقمي وكيف يعمل؟", "ما هو الحساب الرقمي ؟"),
+    ("كم رسوم تفعيل الحساب الرقمي؟", "ما هي رسوم تفعيل الحساب الرقمي؟"),
+    ("ما الفرق بين الحساب الجاري والحساب الرقمي؟", "ماهو الفرق بين الحساب الرقمي والحساب الجاري؟"),
+    ("أضعت بطاقة الصراف الآلي ماذا أفعل؟", "ماذا يجب أن أفعل في حال  فقدان /ضياع بطاقة الصراف الآلي؟"),
+    ("كيف ألغي بطاقة الصراف؟", "كيف يمكن إلغاء بطاقة الصراف الآلي؟"),
+    ("كم يوم تحتاج البطاقة حتى تصل بعد الطلب؟", "ماهي مدة استلام البطاقة بعد طلبها من الفروع أو التطبيق أو مركز الاتصالات؟"),
+    ("ما هو دوام البنك؟", "ماهي عن أوقات الدوام في البنك؟"),
+    ("كيف أحصل على دفتر شيكات؟", "كيف يمكن أ ن أحصل على دفتر الشيكات؟"),
+    ("هل أستطيع استلام حوالة من بنك خارج سوريا؟", "هل يمكن استلام حوالة خارجية (بنوك خارج سورية)؟"),
+    ("كيف أحول مبلغ من حسابي لحساب شخص ثاني؟", "كيف يمكن  تحويل الزبون من حسابه إلى حساب شخص آخر؟"),
+]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default=settings.MD_PATH or "app/data/info.md")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    text = pathlib.Path(args.path).read_text(encoding="utf-8")
+    started = time.perf_counter()
+    index = FaqIndex.from_text(text)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    queries = []
+    for position, entry in enumerate(index.entries):
+        queries.append((position, entry.question))
+        queries.append((position, normalize_question(entry.question)))
+
+    latencies = []
+    correct = above_threshold = 0
+    for _ in range(args.rounds):
+        for position, query in queries:
+            started = time.perf_counter()
+            (entry, score), = index.search(query, k=1)
+            latencies.append((time.perf_counter() - started) * 1e6)
+            correct += entry is index.entries[position]
+            above_threshold += score >= settings.FAQ_MATCH_THRESHOLD
+
+    total = len(queries) * args.rounds
+    print(f"entries: {len(index.entries)}, vocabulary: {len(index.vocabulary)} n-grams, build: {build_ms:.1f} ms")
+    print(f"queries: {total} ({args.rounds} rounds x {len(queries)})")
+    print(
+        f"latency per query (us): mean {statistics.mean(latencies):.1f}, p50 {percentile(latencies, 50):.1f}, "
+        f"p95 {percentile(latencies, 95):.1f}, p99 {percentile(latencies, 99):.1f}"
+    )
+    print(f"top-1 accuracy: {correct / total:.3f}, above threshold {settings.FAQ_MATCH_THRESHOLD}: {above_threshold / total:.3f}")
+
+    questions = {entry.question: entry for entry in index.entries}
+    found = hits = wrong_hits = 0
+    scores = []
+    for query, question in PARAPHRASES:
+        (entry, score), = index.search(query, k=1)
+        scores.append(score)
+        matched = entry is questions[question]
+        found += matched
+        if score >= settings.FAQ_MATCH_THRESHOLD:
+            hits += matched
+            wrong_hits += not matched
+    print(
+        f"paraphrases: {len(PARAPHRASES)}, top-1 accuracy {found / len(PARAPHRASES):.3f}, "
+        f"score p50 {percentile(scores, 50):.3f}, max {max(scores):.3f}"
+    )
+    print(
+        f"paraphrases answered from the FAQ at threshold {settings.FAQ_MATCH_THRESHOLD}: "
+        f"{hits / len(PARAPHRASES):.3f} (wrong answers: {wrong_hits})"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Document load time: original serial extraction vs content-addressed ingestion.
+
+Times, for the PDF at --pdf (default PDF_PATH),
+
+- "original": the serial PyPDF2 loop with `text +=`, as startup used to run it;
+- "parallel": ingestion.extract_text_from_pdf over a process pool of --workers
+  (default: the CPU count; it stays serial with fewer than 2 CPUs);
+- "cached": ingestion.load_document with the extracted text already on disk,
+  i.e. a restart with an unchanged document (hashing plus one file read).
+
+Run from the repository root:
+
+    python -m benchmarks.ingestion_benchmark --pdf data/info.pdf --workers 4
+"""
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+import PyPDF2
+from app.config import settings
+from app.services import ingestion
+
+def extract_original(pdf_path: pathlib.Path) -> str:
+    with pdf_path.open("rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        text = ""
+        for page in reader.pages:
+            page_text = page.extract_text()
+            if page_text:
+                text += page_text + "\n"
+    return text
+
+def timed(call):
+    started = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", default=settings.PDF_PATH or "data/info.pdf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    pdf_path = pathlib.Path(args.pdf)
+
+    original, original_seconds = timed(lambda: extract_original(pdf_path))
+    parallel, parallel_seconds = timed(lambda: ingestion.extract_text_from_pdf(pdf_path, args.workers))
+    with tempfile.TemporaryDirectory() as extracted_dir:
+        settings.EXTRACTED_TEXT_DIR = extracted_dir
+        ingestion.load_document(pdf_path, "pdf")
+        (cached, _), cached_seconds = timed(lambda: ingestion.load_document(pdf_path, "pdf"))
+
+    print(f"{pdf_path} ({len(original)} chars), {args.workers} worker(s)")
+    print(f"  original: {original_seconds * 1000:9.1f} ms")
+    print(f"  parallel: {parallel_seconds * 1000:9.1f} ms  (same text: {parallel == original})")
+    print(f"    cached: {cached_seconds * 1000:9.1f} ms  (same text: {cached == original})")
+
+if __name__ == "__main__":
+    main()
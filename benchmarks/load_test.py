@@ -0,0 +1,200 @@
+"""Offline load test of the conversation API: create -> send_message -> history.
+
+Runs the FastAPI app in process (through httpx's ASGI transport, so no network
+or server process is involved) with the fake Gemini client of
+benchmarks.fake_gemini, against either a scratch database on a local MongoDB
+or an in-memory stand-in (mongomock-motor, `pip install mongomock-motor`).
+
+Each virtual user creates a conversation, sends --messages messages and reads
+the history back; --concurrency users run at a time until --users are done.
+Reported: requests per second, p50/p95/p99 latency per operation, event loop
+lag (how late a 10 ms timer fires while the test runs) and memory per chat
+session. With a fixed --seed the fake Gemini latencies are reproducible, so
+runs before and after a change are comparable; --output saves the numbers as
+JSON.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --mongo memory --users 500 --concurrency 100 --messages 3
+    python -m benchmarks.load_test --mongo mongodb://localhost:27017 --stream --output after.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import statistics
+import time
+import tracemalloc
+from app.config import settings
+from app.services.mongodb import MongoDBClient
+
+LAG_INTERVAL = 0.01
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+def summarize(latencies: list[float]) -> dict:
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def request(self, operation: str, call):
+        # The response body, streamed or not, is fully read before `call` returns.
+        started = time.perf_counter()
+        response = await call
+        self.latencies.setdefault(operation, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+            return None
+        return response
+
+async def monitor_loop_lag(lags: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - started - LAG_INTERVAL))
+
+async def run_user(client, recorder: Recorder, user_id: str, args):
+    response = await recorder.request("create", client.post("/api/conversations", json={"user_id": user_id}))
+    if response is None:
+        return
+    conversation_id = response.json()["_id"]
+    path = f"/api/conversations/{conversation_id}/messages" + ("/stream" if args.stream else "")
+    operation = "send_stream" if args.stream else "send"
+    for i in range(args.messages):
+        # Distinct questions, so the answer cache and request coalescing stay out of the measurement.
+        payload = {"user_id": user_id, "message": f"سؤال رقم {i} من {user_id} عن القروض الشخصية"}
+        await recorder.request(operation, client.post(path, json=payload))
+    await recorder.request(
+        "history", client.get(f"/api/conversations/{conversation_id}/history", params={"user_id": user_id})
+    )
+
+def use_database(args):
+    # Must run before the app first asks MongoDBClient for a connection.
+    if args.mongo == "memory":
+        from mongomock_motor import AsyncMongoMockClient
+        MongoDBClient._client = AsyncMongoMockClient()
+    else:
+        import motor.motor_asyncio
+        MongoDBClient._client = motor.motor_asyncio.AsyncIOMotorClient(args.mongo)
+    settings.MONGODB_DB = args.db
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="memory", help='"memory" or a MongoDB URI')
+    parser.add_argument("--db", default="chat_load_test", help="Scratch database, dropped before and after the run")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3, help="Messages per conversation")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming endpoint")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean fake Gemini latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--prompt-tokens", type=int, default=30000)
+    parser.add_argument("--response-tokens", type=int, default=120)
+    parser.add_argument("--chunks", type=int, default=8, help="Chunks per streamed answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rpm", type=int, default=0, help="GEMINI_RPM for the run, 0 for no limit")
+    parser.add_argument("--tpm", type=int, default=0, help="GEMINI_TPM for the run, 0 for no limit")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also trace Python allocations (slower)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    use_database(args)
+    # The scheduler reads the quotas when the (fake) client is created.
+    settings.GEMINI_RPM, settings.GEMINI_TPM = args.rpm, args.tpm
+    from benchmarks.fake_gemini import FakeGeminiProfile, install_fake_gemini
+    install_fake_gemini(FakeGeminiProfile(
+        latency=args.latency, jitter=args.jitter, prompt_tokens=args.prompt_tokens,
+        response_tokens=args.response_tokens, chunks=args.chunks, seed=args.seed,
+    ))
+    import httpx
+    from app.main import app
+    from app.services.admission import admission
+    from app.services.chat_session_manager import ChatSessionManager
+    # One log line per request would dominate the measurement.
+    logging.getLogger("bemo").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Quotas and the session cap would otherwise shape the load.
+    admission.limit = settings.MAX_REQUESTS_PER_DAY = max(settings.MAX_REQUESTS_PER_DAY, args.messages + 1)
+    settings.MAX_ACTIVE_SESSIONS = max(settings.MAX_ACTIVE_SESSIONS, args.users)
+
+    await MongoDBClient.get_client().drop_database(args.db)
+    await MongoDBClient.ensure_indexes()
+
+    recorder = Recorder()
+    lags: list[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lags, stop))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.tracemalloc:
+        tracemalloc.start()
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def limited(client, user_id):
+        async with slots:
+            await run_user(client, recorder, user_id, args)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(client, f"load-user-{i}") for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_task
+    sessions = ChatSessionManager.metrics()
+    traced = tracemalloc.get_traced_memory()[0] if args.tracemalloc else None
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    await MongoDBClient.get_client().drop_database(args.db)
+
+    requests = sum(len(latencies) for latencies in recorder.latencies.values())
+    active = sessions["active_sessions"] or 1
+    results = {
+        "config": vars(args),
+        "elapsed_seconds": elapsed,
+        "requests": requests,
+        "requests_per_second": requests / elapsed,
+        "operations": {op: summarize(latencies) for op, latencies in recorder.latencies.items()},
+        "errors": recorder.errors,
+        "loop_lag_ms": {
+            "mean": statistics.mean(lags) * 1000 if lags else 0.0,
+            "p99": percentile(lags, 99) * 1000,
+            "max": max(lags, default=0.0) * 1000,
+        },
+        "sessions": sessions["active_sessions"],
+        "estimated_bytes_per_session": sessions["estimated_bytes_per_session"],
+        # ru_maxrss is in KiB on Linux; peak growth over the run, spread over the live sessions.
+        "rss_growth_bytes_per_session": (rss_after - rss_before) * 1024 / active,
+        "traced_bytes_per_session": traced / active if traced is not None else None,
+    }
+
+    print(f"{requests} requests in {elapsed:.2f}s: {results['requests_per_second']:.1f} req/s, errors {recorder.errors or 0}")
+    for op, stats in results["operations"].items():
+        print(
+            f"{op:>12}: n={stats['count']:6d}  mean {stats['mean_ms']:8.1f} ms  p50 {stats['p50_ms']:8.1f} ms  "
+            f"p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms"
+        )
+    lag = results["loop_lag_ms"]
+    print(f"event loop lag: mean {lag['mean']:.2f} ms, p99 {lag['p99']:.2f} ms, max {lag['max']:.2f} ms")
+    print(
+        f"memory: {results['sessions']} sessions, ~{results['estimated_bytes_per_session']:.0f} B/session estimated, "
+        f"{results['rss_growth_bytes_per_session']:.0f} B/session RSS growth"
+        + (f", {results['traced_bytes_per_session']:.0f} B/session traced" if traced is not None else "")
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
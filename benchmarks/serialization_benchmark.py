@@ -0,0 +1,74 @@
+"""Encoding time of a conversation history response: response_model vs orjson.
+
+Builds --messages stored messages (as read from MongoDB: ObjectId ids,
+datetimes) and times turning them into the JSON body of
+GET /conversations/{id}/history
+
+- "response_model": what FastAPI does for response_model=list[Message]:
+  validate every message into a Message, jsonable_encoder, then json.dumps;
+- "orjson": the current path, message_fields() plus a FastJSONResponse render.
+
+Run from the repository root:
+
+    python -m benchmarks.serialization_benchmark --messages 2000 --rounds 20
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from app.models import Message
+from app.services.serialization import FastJSONResponse, message_fields
+
+def stored_messages(count: int) -> list[dict]:
+    started = datetime.utcnow()
+    messages = []
+    for i in range(count):
+        message = {
+            "_id": ObjectId(),
+            "role": "user" if i % 2 == 0 else "model",
+            "content": "ما هي شروط القرض الشخصي؟ " * (2 if i % 2 == 0 else 20),
+            "timestamp": started + timedelta(seconds=i * 30),
+        }
+        if i % 2:
+            message.update(token_count=120, prompt_token_count=30000)
+        messages.append(message)
+    return messages
+
+def response_model_body(messages: list[dict]) -> bytes:
+    adapter = TypeAdapter(list[Message])
+    validated = adapter.validate_python([{**message, "_id": str(message["_id"])} for message in messages])
+    return json.dumps(jsonable_encoder(validated, by_alias=True), ensure_ascii=False).encode("utf-8")
+
+def orjson_body(messages: list[dict]) -> bytes:
+    return FastJSONResponse([message_fields(message) for message in messages]).body
+
+def time_ms(encode, messages, rounds: int) -> list[float]:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        encode(messages)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = stored_messages(args.messages)
+    assert json.loads(response_model_body(messages)) == json.loads(orjson_body(messages))
+    print(f"{args.messages} messages, {args.rounds} rounds")
+    results = {}
+    for name, encode in (("response_model", response_model_body), ("orjson", orjson_body)):
+        timings = time_ms(encode, messages, args.rounds)
+        results[name] = statistics.median(timings)
+        print(f"{name:>15}: median {results[name]:.2f} ms, min {min(timings):.2f} ms")
+    print(f"speedup: {results['response_model'] / results['orjson']:.1f}x")
+
+if __name__ == "__main__":
+    main()
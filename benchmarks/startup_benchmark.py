@@ -0,0 +1,122 @@
+"""Cold start time: importing the app, time to live and time to ready.
+
+Measures
+
+- "import": `import app.main` in a fresh interpreter (median of --repeats),
+  and whether PyPDF2 was imported along the way;
+- "live": from the startup event to the first answered /health/live;
+- "ready": from the startup event until /health/ready returns 200, with the
+  duration of each warm-up step. Their sum is what a startup running the
+  steps one after the other would take.
+
+The Gemini client is the fake of benchmarks.fake_gemini, whose context cache
+takes --cache-latency seconds to initialize; MongoDB is an in-memory stand-in
+(mongomock-motor) or a scratch database on a local server.
+
+Run from the repository root:
+
+    python -m benchmarks.startup_benchmark --cache-latency 2
+    python -m benchmarks.startup_benchmark --mongo mongodb://localhost:27017 --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import time
+from app.config import settings
+from app.services.mongodb import MongoDBClient
+
+IMPORT_PROBE = (
+    "import sys, time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started, 'PyPDF2' in sys.modules)"
+)
+
+def measure_import(repeats: int) -> dict:
+    seconds, pypdf2 = [], False
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], capture_output=True, text=True, check=True).stdout
+        elapsed, imported = output.split()
+        seconds.append(float(elapsed))
+        pypdf2 = pypdf2 or imported == "True"
+    return {"median_seconds": statistics.median(seconds), "runs": seconds, "pypdf2_imported": pypdf2}
+
+def use_database(args):
+    if args.mongo == "memory":
+        from mongomock_motor import AsyncMongoMockClient
+        MongoDBClient._client = AsyncMongoMockClient()
+    else:
+        import motor.motor_asyncio
+        MongoDBClient._client = motor.motor_asyncio.AsyncIOMotorClient(args.mongo)
+    settings.MONGODB_DB = args.db
+
+async def measure_startup(args) -> dict:
+    use_database(args)
+    settings.CONTEXT_MODE = args.context_mode
+    from benchmarks.fake_gemini import FakeGeminiProfile, install_fake_gemini
+    install_fake_gemini(FakeGeminiProfile(cache_latency=args.cache_latency, latency=args.latency))
+    import httpx
+    from app.main import app
+    logging.getLogger("bemo").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    await MongoDBClient.get_client().drop_database(args.db)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+        started = time.perf_counter()
+        # Runs the startup event on entry and the shutdown event on exit, as the server would.
+        async with app.router.lifespan_context(app):
+            live = await client.get("/health/live")
+            live_seconds = time.perf_counter() - started
+            probes = 0
+            while True:
+                probes += 1
+                ready = await client.get("/health/ready")
+                if ready.status_code == 200:
+                    break
+                await asyncio.sleep(args.poll_interval)
+            ready_seconds = time.perf_counter() - started
+            status = ready.json()
+
+    await MongoDBClient.get_client().drop_database(args.db)
+    steps = {name: step["seconds"] for name, step in status["steps"].items()}
+    return {
+        "live_seconds": live_seconds,
+        "live_status": live.status_code,
+        "ready_seconds": ready_seconds,
+        "readiness_probes": probes,
+        "steps": steps,
+        "sequential_seconds": sum(seconds or 0 for seconds in steps.values()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="memory", help='"memory" or a MongoDB URI')
+    parser.add_argument("--db", default="chat_startup_benchmark", help="Scratch database, dropped before and after the run")
+    parser.add_argument("--context-mode", default="cache", choices=["cache", "retrieval"])
+    parser.add_argument("--cache-latency", type=float, default=2.0, help="Seconds the fake context cache takes to initialize")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds of other fake Gemini calls")
+    parser.add_argument("--poll-interval", type=float, default=0.01, help="Seconds between readiness probes")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters timed importing the app")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {"config": vars(args), "import": measure_import(args.repeats)}
+    results["startup"] = asyncio.run(measure_startup(args))
+
+    imported = results["import"]
+    print(f"import app.main: median {imported['median_seconds'] * 1000:.0f} ms, PyPDF2 imported: {imported['pypdf2_imported']}")
+    startup = results["startup"]
+    print(f"live after {startup['live_seconds'] * 1000:.1f} ms (status {startup['live_status']})")
+    print(f"ready after {startup['ready_seconds'] * 1000:.1f} ms ({startup['readiness_probes']} probes)")
+    for name, seconds in startup["steps"].items():
+        print(f"{name:>14}: {seconds * 1000:8.1f} ms")
+    print(f"steps run one after the other: {startup['sequential_seconds'] * 1000:.1f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
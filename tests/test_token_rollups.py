@@ -0,0 +1,34 @@
+"""Token rollups of evaluation runs survive rebuild_rollups.
+
+Runs against mongomock-motor and the fake Gemini client of the benchmarks:
+
+    pip install pytest mongomock-motor
+    python -m pytest tests
+"""
+import asyncio
+from datetime import date
+from mongomock_motor import AsyncMongoMockClient
+from app.config import settings
+from app.services.mongodb import MongoDBClient
+from app.services import evaluation, token_analytics
+from benchmarks.fake_gemini import FakeGeminiProfile, install_fake_gemini
+
+def test_rebuild_keeps_evaluation_rollups():
+    MongoDBClient._client = AsyncMongoMockClient()
+    settings.MONGODB_DB = "test_token_rollups"
+    settings.MONGO_WRITE_BEHIND = False
+    install_fake_gemini(FakeGeminiProfile(latency=0, jitter=0, cache_latency=0))
+
+    async def run():
+        questions = evaluation.parse_questions(b"first question\nsecond question\n")
+        results = [result async for result in evaluation.run_evaluation(questions, concurrency=2)]
+        assert results[-1]["succeeded"] == 2
+        before = await token_analytics.usage(["user_id"], date.today(), date.today())
+        await token_analytics.rebuild_rollups(date.today(), date.today())
+        after = await token_analytics.usage(["user_id"], date.today(), date.today())
+        return before, after
+
+    before, after = asyncio.run(run())
+    assert [row["user_id"] for row in before] == [evaluation.EVALUATION_USER_ID]
+    assert before[0]["turns"] == 2
+    assert after == before